@@ -1,6 +1,17 @@
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .utils.dispatch import WebhookDispatcher
+from .utils.dedup import DedupCache
+from .utils.whatsapp_client import WhatsAppClient
+from .utils.async_whatsapp_client import AsyncWhatsAppClient
+from .utils.outbound_scheduler import OutboundScheduler
+from .utils.outbound_queue import DurableOutboundQueue
+from .utils.broadcast import BroadcastManager
+from .cli import register_commands
+from .utils.whatsapp_utils import process_webhook_event
+from .data import storage, init_storage, message_log, delivery_status
+from .services.openai_service import init_openai, reply_executor
 
 
 def create_app():
@@ -10,7 +21,66 @@ def create_app():
     load_configurations(app)
     configure_logging()
 
+    # Storage and the OpenAI client are only configured here; each process
+    # builds them on first use, which keeps `gunicorn --preload` forks safe
+    init_storage(app)
+    init_openai(app)
+
+    # Shared, pooled client for outbound Graph API calls
+    WhatsAppClient(app)
+    AsyncWhatsAppClient(app)
+
+    # Rate-limited, prioritized queue in front of the client, if enabled
+    if app.config["OUTBOUND_SCHEDULER"]:
+        OutboundScheduler(app)
+
+    # Persist outbound messages and retry them in the background, if enabled
+    if app.config["DURABLE_QUEUE"]:
+        DurableOutboundQueue(app)
+
+    # Broadcast jobs, sent as bulk through the outbound scheduler
+    BroadcastManager(app)
+
+    # Message id dedup, optionally backed by the storage layer across restarts
+    DedupCache(app, store=storage if app.config["DEDUP_PERSISTENT"] else None)
+
+    # Background worker pool for webhook events, if enabled
+    if app.config["WEBHOOK_ASYNC"]:
+        WebhookDispatcher(
+            app,
+            handler=process_webhook_event,
+            max_size=app.config["WEBHOOK_QUEUE_SIZE"],
+            workers=app.config["WEBHOOK_WORKERS"],
+        )
+
     # Import and register blueprints, if any
     app.register_blueprint(webhook_blueprint)
 
+    # `flask broadcast ...` and `flask outbound ...` commands
+    register_commands(app)
+
     return app
+
+
+def shutdown_app(app, timeout=30):
+    """
+    Stop the app's background work in pipeline order and flush storage.
+
+    Each stage drains before the one it feeds: webhook events, then assistant
+    replies, then the outbound queue and scheduler, then the message log and
+    the storage backend. Called by the gunicorn `worker_exit` hook; the atexit
+    handlers each component registers still cover other ways of exiting.
+    """
+    if "webhook_dispatcher" in app.extensions:
+        app.extensions["webhook_dispatcher"].shutdown(timeout)
+    reply_executor.shutdown()
+    if "outbound_queue" in app.extensions:
+        app.extensions["outbound_queue"].shutdown(timeout)
+    if "outbound_scheduler" in app.extensions:
+        app.extensions["outbound_scheduler"].shutdown(timeout)
+    app.extensions["broadcasts"].shutdown(timeout)
+    app.extensions["async_whatsapp_client"].close()
+    app.extensions["whatsapp_client"].close()
+    delivery_status.close()
+    message_log.close()
+    storage.close()
@@ -0,0 +1,183 @@
+import asyncio
+import io
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from flask import Flask
+
+from .decorators.security import read_and_sign_async, signature_matches
+from .utils.webhook_events import parse_webhook
+from .utils.whatsapp_utils import (
+    collect_outbound,
+    is_valid_whatsapp_message,
+    process_status_updates,
+    process_webhook_event,
+    send_messages_async,
+)
+from .views import check_verification
+
+FLASK_APP = web.AppKey("flask_app", Flask)
+
+
+def _error(message, status):
+    return web.json_response({"status": "error", "message": message}, status=status)
+
+
+async def webhook_get(request):
+    flask_app = request.app[FLASK_APP]
+    body, status = check_verification(request.query, flask_app.config["VERIFY_TOKEN"])
+    if isinstance(body, dict):
+        return web.json_response(body, status=status)
+    return web.Response(text=body, status=status)
+
+
+def _run_handlers(flask_app, event):
+    with flask_app.app_context():
+        return collect_outbound(process_webhook_event, event)
+
+
+async def webhook_post(request):
+    """
+    The async counterpart of `handle_message()` in views.py.
+
+    The signature is checked as the body streams in. The shared synchronous
+    handlers (storage, dedup, message building) run on the thread pool, and
+    the Graph API sends they make are awaited here on the event loop, so a
+    request waiting on the Graph API holds no thread.
+    """
+    flask_app = request.app[FLASK_APP]
+    config = flask_app.config
+    max_bytes = config["WEBHOOK_MAX_BODY_BYTES"]
+    if request.content_length is not None and request.content_length > max_bytes:
+        logging.info("Webhook body too large")
+        return _error("Payload too large", 413)
+    raw, expected_signature = await read_and_sign_async(request.content, max_bytes, config["APP_SECRET"])
+    if raw is None:
+        logging.info("Webhook body too large")
+        return _error("Payload too large", 413)
+    if not signature_matches(expected_signature, request.headers.get("X-Hub-Signature-256", "")):
+        logging.info("Signature verification failed!")
+        return _error("Invalid signature", 403)
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        logging.error("Failed to decode JSON")
+        return _error("Invalid JSON provided", 400)
+
+    try:
+        event = parse_webhook(body)
+    except (AttributeError, TypeError, ValueError) as e:
+        logging.error(f"Malformed webhook body: {e}")
+        return _error("Invalid webhook payload", 400)
+    # Status updates only touch an in-memory buffer, so they stay on the loop
+    if event.statuses:
+        process_status_updates(event.statuses)
+        if not event.messages:
+            return web.json_response({"status": "ok"})
+    if not is_valid_whatsapp_message(event):
+        return _error("Not a WhatsApp API event", 404)
+
+    logging.info(f"request body: {body}")
+    if config["WEBHOOK_ASYNC"]:
+        if not flask_app.extensions["webhook_dispatcher"].submit(event):
+            return _error("Queue full", 503)
+        return web.json_response({"status": "ok"})
+    payloads = await asyncio.to_thread(_run_handlers, flask_app, event)
+    await send_messages_async(flask_app.extensions["async_whatsapp_client"], payloads)
+    return web.json_response({"status": "ok"})
+
+
+def _wsgi_environ(request, body):
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        # WSGI wants the raw bytes as latin-1 text, not yarl's decoded strings
+        "PATH_INFO": request.path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": request.rel_url.raw_query_string,
+        "SERVER_NAME": request.url.host or "localhost",
+        "SERVER_PORT": str(request.url.port or ""),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "CONTENT_TYPE": request.headers.get("Content-Type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name in request.headers:
+        key = "HTTP_" + name.upper().replace("-", "_")
+        if key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+            environ[key] = ",".join(request.headers.getall(name))
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = status
+        response["headers"] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], content
+
+
+async def flask_fallback(request):
+    """Serve every other route (order form, metrics) through the Flask app."""
+    flask_app = request.app[FLASK_APP]
+    environ = _wsgi_environ(request, await request.read())
+    status, headers, content = await asyncio.to_thread(_call_wsgi, flask_app.wsgi_app, environ)
+    code, _, reason = status.partition(" ")
+    response = web.Response(status=int(code), reason=reason or None, body=content)
+    for name, value in headers:
+        if name.lower() != "content-length":
+            response.headers.add(name, value)
+    return response
+
+
+async def _on_startup(aio_app):
+    flask_app = aio_app[FLASK_APP]
+    loop = asyncio.get_running_loop()
+    # Sized for handlers that mostly wait on storage, not for the requests
+    # in flight; those only need the loop
+    loop.set_default_executor(
+        ThreadPoolExecutor(max_workers=flask_app.config["ASYNC_HANDLER_THREADS"], thread_name_prefix="async-handler")
+    )
+    flask_app.extensions["async_whatsapp_client"].attach(loop)
+
+
+async def _on_cleanup(aio_app):
+    from . import shutdown_app
+
+    flask_app = aio_app[FLASK_APP]
+    await flask_app.extensions["async_whatsapp_client"].aclose()
+    await asyncio.to_thread(shutdown_app, flask_app)
+
+
+def create_async_app(flask_app):
+    """
+    Build an aiohttp application serving `flask_app`'s webhook asynchronously.
+
+    GET and POST /webhook are handled natively; every other route is passed
+    to the Flask app on the thread pool.
+    """
+    aio_app = web.Application(client_max_size=flask_app.config["WEBHOOK_MAX_BODY_BYTES"])
+    aio_app[FLASK_APP] = flask_app
+    aio_app.router.add_get("/webhook", webhook_get)
+    aio_app.router.add_post("/webhook", webhook_post)
+    aio_app.router.add_route("*", "/{tail:.*}", flask_fallback)
+    aio_app.on_startup.append(_on_startup)
+    aio_app.on_cleanup.append(_on_cleanup)
+    return aio_app
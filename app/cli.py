@@ -0,0 +1,125 @@
+import json
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.data import storage
+from app.utils.broadcast import get_broadcast_manager
+from app.utils.outbound_queue import DurableOutboundQueue
+
+broadcast_cli = AppGroup("broadcast", help="Send a message to many recipients.")
+outbound_cli = AppGroup("outbound", help="Inspect the durable outbound queue and its dead letters.")
+
+
+def _echo_broadcast(broadcast):
+    counts = ", ".join(f"{status} {count}" for status, count in sorted(broadcast["counts"].items()))
+    click.echo(f"#{broadcast['id']} {broadcast['builder']} [{broadcast['status']}] {broadcast['total']} recipients: {counts}")
+
+
+@broadcast_cli.command("send")
+@click.argument("builder")
+@click.argument("recipients_file", type=click.File("r"))
+@click.option("--param", "-p", multiple=True, help="Builder parameter as key=value, e.g. text=Hello.")
+@click.option("--background", is_flag=True, help="Record the job and return without waiting.")
+def send_broadcast(builder, recipients_file, param, background):
+    """Send BUILDER's message to every wa_id in RECIPIENTS_FILE (one per line)."""
+    params = dict(item.split("=", 1) for item in param)
+    recipients = [line.strip() for line in recipients_file]
+    manager = get_broadcast_manager()
+    try:
+        broadcast_id = manager.create(builder, recipients, params)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Broadcast {broadcast_id} created")
+    if background:
+        return
+    _echo_broadcast(manager.run(broadcast_id))
+
+
+@broadcast_cli.command("resume")
+@click.argument("broadcast_id", type=int)
+def resume_broadcast(broadcast_id):
+    """Continue a broadcast that stopped part-way, without resending."""
+    if storage.get_broadcast(broadcast_id) is None:
+        raise click.ClickException(f"Unknown broadcast: {broadcast_id}")
+    _echo_broadcast(get_broadcast_manager().resume(broadcast_id))
+
+
+@broadcast_cli.command("cancel")
+@click.argument("broadcast_id", type=int)
+def cancel_broadcast(broadcast_id):
+    """Stop a running broadcast from claiming more recipients."""
+    if not get_broadcast_manager().cancel(broadcast_id):
+        raise click.ClickException(f"Unknown broadcast: {broadcast_id}")
+    click.echo(f"Broadcast {broadcast_id} cancelled")
+
+
+@broadcast_cli.command("status")
+@click.argument("broadcast_id", type=int, required=False)
+@click.option("--recipients", "status", help="Also list recipients with this status, e.g. failed.")
+def broadcast_status(broadcast_id, status):
+    """Show one broadcast, or all of them."""
+    if broadcast_id is None:
+        for broadcast in storage.get_broadcasts():
+            _echo_broadcast(broadcast)
+        return
+    broadcast = storage.get_broadcast(broadcast_id)
+    if broadcast is None:
+        raise click.ClickException(f"Unknown broadcast: {broadcast_id}")
+    _echo_broadcast(broadcast)
+    if status:
+        for row in storage.get_broadcast_recipients(broadcast_id, status):
+            click.echo(json.dumps(row))
+
+
+def _outbound_queue():
+    # The commands work whether or not DURABLE_QUEUE is on in this process,
+    # e.g. to replay dead letters after turning it off
+    queue = current_app.extensions.get("outbound_queue")
+    return queue if queue is not None else DurableOutboundQueue(current_app)
+
+
+@outbound_cli.command("status")
+def outbound_status():
+    """Show how many messages are queued, due now and dead-lettered."""
+    counts = _outbound_queue().db.get_outbound_counts()
+    click.echo(f"{counts['queued']} queued ({counts['due']} due now), {counts['dead_letters']} dead letters")
+
+
+@outbound_cli.command("dead-letters")
+@click.option("--limit", default=50, show_default=True, help="Most recent dead letters to list.")
+@click.option("--payload", is_flag=True, help="Also print each message payload.")
+def list_dead_letters(limit, payload):
+    """List messages that were given up on, newest first."""
+    for row in _outbound_queue().db.get_dead_letters(limit):
+        click.echo(
+            f"#{row['id']} to {row['recipient']} after {row['attempts']} attempts "
+            f"at {datetime.fromtimestamp(row['failed_at']):%Y-%m-%d %H:%M:%S}: {row['last_error']}"
+        )
+        if payload:
+            click.echo(f"  {row['payload']}")
+
+
+@outbound_cli.command("replay")
+@click.argument("dead_letter_ids", type=int, nargs=-1)
+@click.option("--all", "replay_all", is_flag=True, help="Replay every dead letter.")
+def replay_dead_letters(dead_letter_ids, replay_all):
+    """Queue dead letters for sending again, with a fresh set of attempts."""
+    if not dead_letter_ids and not replay_all:
+        raise click.UsageError("Give dead letter ids, or --all")
+    replayed = _outbound_queue().db.replay_dead_letters(None if replay_all else dead_letter_ids)
+    click.echo(f"{replayed} dead letters queued again")
+
+
+@outbound_cli.command("discard")
+@click.argument("dead_letter_ids", type=int, nargs=-1, required=True)
+def discard_dead_letters(dead_letter_ids):
+    """Delete dead letters that should never be sent."""
+    click.echo(f"{_outbound_queue().db.delete_dead_letters(dead_letter_ids)} dead letters discarded")
+
+
+def register_commands(app):
+    app.cli.add_command(broadcast_cli)
+    app.cli.add_command(outbound_cli)
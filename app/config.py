@@ -16,6 +16,94 @@ def load_configurations(app):
     app.config["VERIFY_TOKEN"] = os.getenv("VERIFY_TOKEN")
     app.config["WHATSAPP_NUMBER"] = os.getenv("WHATSAPP_NUMBER")
     app.config["APPROVER_WAID"] = os.getenv("APPROVER_WAID")
+    app.config["WEBHOOK_MAX_BODY_BYTES"] = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(1024 * 1024)))
+
+    # Server started by run.py: "gunicorn" (pre-forked workers), "threaded"
+    # (the Werkzeug server, one process) or "aiohttp" (async webhook, one
+    # process); 0 workers means derive from CPUs
+    app.config["SERVER"] = os.getenv("SERVER", "gunicorn")
+    app.config["SERVER_HOST"] = os.getenv("SERVER_HOST", "0.0.0.0")
+    app.config["SERVER_PORT"] = int(os.getenv("SERVER_PORT", "8000"))
+    app.config["SERVER_WORKERS"] = int(os.getenv("SERVER_WORKERS", "0"))
+    app.config["SERVER_WORKER_CLASS"] = os.getenv("SERVER_WORKER_CLASS", "gthread")
+    app.config["SERVER_THREADS"] = int(os.getenv("SERVER_THREADS", "8"))
+    app.config["SERVER_PRELOAD"] = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    app.config["SERVER_TIMEOUT"] = int(os.getenv("SERVER_TIMEOUT", "120"))
+    app.config["SERVER_GRACEFUL_TIMEOUT"] = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "90"))
+    app.config["SERVER_MAX_REQUESTS"] = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+    # Threads the aiohttp server runs the synchronous handlers on
+    app.config["ASYNC_HANDLER_THREADS"] = int(os.getenv("ASYNC_HANDLER_THREADS", "32"))
+
+    # Pooled Graph API client
+    app.config["GRAPH_TIMEOUT"] = float(os.getenv("GRAPH_TIMEOUT", "10"))
+    app.config["GRAPH_POOL_SIZE"] = int(os.getenv("GRAPH_POOL_SIZE", "10"))
+    app.config["GRAPH_MAX_RETRIES"] = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+    app.config["GRAPH_BACKOFF_FACTOR"] = float(os.getenv("GRAPH_BACKOFF_FACTOR", "0.5"))
+
+    # asyncio send path: views submit to a shared aiohttp session instead of blocking
+    app.config["GRAPH_ASYNC_SEND"] = os.getenv("GRAPH_ASYNC_SEND", "false").lower() == "true"
+    app.config["GRAPH_ASYNC_CONCURRENCY"] = int(os.getenv("GRAPH_ASYNC_CONCURRENCY", "50"))
+
+    # Outbound scheduler: token buckets per phone number (throughput tier) and
+    # per recipient (pair rate limit), interactive replies ahead of bulk
+    app.config["OUTBOUND_SCHEDULER"] = os.getenv("OUTBOUND_SCHEDULER", "false").lower() == "true"
+    app.config["OUTBOUND_PHONE_RATE"] = float(os.getenv("OUTBOUND_PHONE_RATE", "80"))
+    app.config["OUTBOUND_PHONE_BURST"] = int(os.getenv("OUTBOUND_PHONE_BURST", "80"))
+    app.config["OUTBOUND_RECIPIENT_RATE"] = float(os.getenv("OUTBOUND_RECIPIENT_RATE", str(1 / 6)))
+    app.config["OUTBOUND_RECIPIENT_BURST"] = int(os.getenv("OUTBOUND_RECIPIENT_BURST", "45"))
+    app.config["OUTBOUND_QUEUE_SIZE"] = int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000"))
+    app.config["OUTBOUND_WORKERS"] = int(os.getenv("OUTBOUND_WORKERS", "16"))
+    app.config["OUTBOUND_MAX_ATTEMPTS"] = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+    app.config["OUTBOUND_THROTTLE_BACKOFF"] = float(os.getenv("OUTBOUND_THROTTLE_BACKOFF", "1.0"))
+
+    # Durable outbound queue: replies are committed to SQLite, then sent by
+    # background workers with exponential backoff and dead-lettered at the end
+    app.config["DURABLE_QUEUE"] = os.getenv("DURABLE_QUEUE", "false").lower() == "true"
+    app.config["DURABLE_QUEUE_DB_PATH"] = os.getenv("DURABLE_QUEUE_DB_PATH", "app/data/outbound_queue.db")
+    app.config["DURABLE_QUEUE_WORKERS"] = int(os.getenv("DURABLE_QUEUE_WORKERS", "4"))
+    app.config["DURABLE_QUEUE_BATCH_SIZE"] = int(os.getenv("DURABLE_QUEUE_BATCH_SIZE", "50"))
+    app.config["DURABLE_QUEUE_MAX_ATTEMPTS"] = int(os.getenv("DURABLE_QUEUE_MAX_ATTEMPTS", "8"))
+    app.config["DURABLE_QUEUE_BACKOFF"] = float(os.getenv("DURABLE_QUEUE_BACKOFF", "2.0"))
+    app.config["DURABLE_QUEUE_MAX_BACKOFF"] = float(os.getenv("DURABLE_QUEUE_MAX_BACKOFF", "600"))
+    app.config["DURABLE_QUEUE_LEASE"] = float(os.getenv("DURABLE_QUEUE_LEASE", "120"))
+
+    # Recipients claimed (and persisted as "sending") per broadcast batch
+    app.config["BROADCAST_BATCH_SIZE"] = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+
+    # Skip webhook messages that were already handled (Meta redelivers on slow acks)
+    app.config["DEDUP_CACHE_SIZE"] = int(os.getenv("DEDUP_CACHE_SIZE", "10000"))
+    app.config["DEDUP_TTL_SECONDS"] = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+    app.config["DEDUP_PERSISTENT"] = os.getenv("DEDUP_PERSISTENT", "false").lower() == "true"
+
+    # Background webhook dispatch: acknowledge Meta first, process on a worker pool
+    app.config["WEBHOOK_ASYNC"] = os.getenv("WEBHOOK_ASYNC", "false").lower() == "true"
+    app.config["WEBHOOK_QUEUE_SIZE"] = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    app.config["WEBHOOK_WORKERS"] = int(os.getenv("WEBHOOK_WORKERS", "4"))
+
+    # Storage backend, built lazily in each process on first use
+    app.config["STORAGE_BACKEND"] = os.getenv("STORAGE_BACKEND", "json")
+    app.config["SQLITE_DB_PATH"] = os.getenv("SQLITE_DB_PATH", "app/data/development.db")
+    app.config["JSON_STORAGE_MODE"] = os.getenv("JSON_STORAGE_MODE", "snapshot")
+    app.config["JSON_STORAGE_FSYNC"] = os.getenv("JSON_STORAGE_FSYNC", "batch")
+    app.config["JSON_STORAGE_COMPACT_BYTES"] = int(os.getenv("JSON_STORAGE_COMPACT_BYTES", str(4 * 1024 * 1024)))
+    app.config["MESSAGE_LOG_BATCH_SIZE"] = int(os.getenv("MESSAGE_LOG_BATCH_SIZE", "100"))
+    app.config["MESSAGE_LOG_FLUSH_MS"] = int(os.getenv("MESSAGE_LOG_FLUSH_MS", "200"))
+    app.config["DELIVERY_STATUS_BATCH_SIZE"] = int(os.getenv("DELIVERY_STATUS_BATCH_SIZE", "500"))
+    app.config["DELIVERY_STATUS_FLUSH_MS"] = int(os.getenv("DELIVERY_STATUS_FLUSH_MS", "1000"))
+
+    # OpenAI Assistants; the client is created on first use in each process
+    app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+    app.config["OPENAI_ASSISTANT_ID"] = os.getenv("OPENAI_ASSISTANT_ID")
+    app.config["OPENAI_BASE_URL"] = os.getenv("OPENAI_BASE_URL") or None
+    app.config["ASSISTANT_CACHE_TTL"] = float(os.getenv("ASSISTANT_CACHE_TTL", "3600"))
+    app.config["ASSISTANT_RUN_STREAMING"] = os.getenv("ASSISTANT_RUN_STREAMING", "true").lower() == "true"
+    app.config["ASSISTANT_RUN_DEADLINE"] = float(os.getenv("ASSISTANT_RUN_DEADLINE", "60"))
+    app.config["ASSISTANT_POLL_MIN_INTERVAL"] = float(os.getenv("ASSISTANT_POLL_MIN_INTERVAL", "0.1"))
+    app.config["ASSISTANT_POLL_MAX_INTERVAL"] = float(os.getenv("ASSISTANT_POLL_MAX_INTERVAL", "2.0"))
+    app.config["ASSISTANT_WORKERS"] = int(os.getenv("ASSISTANT_WORKERS", "8"))
+    app.config["ASSISTANT_MAX_BATCH"] = int(os.getenv("ASSISTANT_MAX_BATCH", "10"))
+    app.config["THREADS_DB_PATH"] = os.getenv("THREADS_DB_PATH", "threads_db.sqlite")
+    app.config["THREADS_CACHE_SIZE"] = int(os.getenv("THREADS_CACHE_SIZE", "1024"))
 
 
 def configure_logging():
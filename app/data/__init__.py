@@ -1,6 +1,115 @@
+import atexit
+import os
+import threading
+from dotenv import load_dotenv
 from .json_storage import JsonStorage
+from .db_manager import DatabaseManager
+from .write_behind import MessageLogBuffer, DeliveryStatusBuffer
 
-# Create a singleton instance for development
-storage = JsonStorage()
 
-__all__ = ['storage', 'JsonStorage'] 
\ No newline at end of file
+def create_storage(backend=None, config=None):
+    """
+    Build the storage backend selected by STORAGE_BACKEND ("json" or "sqlite").
+
+    Settings are read from `config` (e.g. `app.config`), falling back to the
+    environment. Both backends expose the same interface, so callers never
+    need to know which one they are talking to.
+    """
+    config = os.environ if config is None else config
+    backend = backend or config.get("STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        return DatabaseManager(config.get("SQLITE_DB_PATH", "app/data/development.db"))
+    if backend == "json":
+        return JsonStorage(
+            mode=config.get("JSON_STORAGE_MODE", "snapshot"),
+            fsync=config.get("JSON_STORAGE_FSYNC", "batch"),
+            compact_bytes=int(config.get("JSON_STORAGE_COMPACT_BYTES", 4 * 1024 * 1024)),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+class StorageProxy:
+    """
+    Stands in for the storage backend and builds it on first use.
+
+    Importing `app.data` therefore reads no files and opens no connections.
+    The backend is built in the process that first touches it and rebuilt
+    after a fork, so a `gunicorn --preload` master never hands its file
+    state, locks or connections to the workers.
+    """
+
+    def __init__(self):
+        self._config = None
+        self._backend = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Registered before the write-behind buffers below, so at exit it runs
+        # after they have flushed into the backend
+        atexit.register(self.close)
+
+    def configure(self, config):
+        """Use `config` for the next backend built; closes any existing one."""
+        with self._lock:
+            # Its own atexit handler was unregistered in get(), so close it here
+            if self.initialized:
+                self._backend.close()
+            self._config = config
+            self._backend = None
+
+    def get(self):
+        """Return the backend for this process, building it if needed."""
+        backend = self._backend
+        if backend is not None and self._pid == os.getpid():
+            return backend
+        with self._lock:
+            if self._backend is None or self._pid != os.getpid():
+                if self._config is None:
+                    # Used outside create_app, e.g. from a script
+                    load_dotenv()
+                self._backend = create_storage(config=self._config)
+                self._pid = os.getpid()
+                # The proxy closes it, in the right order (see __init__)
+                atexit.unregister(self._backend.close)
+            return self._backend
+
+    def close(self):
+        """Close this process's backend, if it was built."""
+        if self.initialized:
+            self._backend.close()
+
+    @property
+    def initialized(self):
+        return self._backend is not None and self._pid == os.getpid()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# Singleton handle on the configured backend, built lazily
+storage = StorageProxy()
+
+# Batches message log writes in front of the storage backend
+message_log = MessageLogBuffer(storage)
+
+# Coalesces sent/delivered/read callbacks per message before writing them
+delivery_status = DeliveryStatusBuffer(storage, message_log, max_records=500, max_delay_ms=1000)
+
+
+def init_storage(app):
+    """
+    Bind the storage layer to the app's configuration.
+
+    Nothing is opened here; the backend is built on first use in each process.
+    """
+    storage.configure(app.config)
+    message_log.configure(app.config["MESSAGE_LOG_BATCH_SIZE"], app.config["MESSAGE_LOG_FLUSH_MS"])
+    delivery_status.configure(
+        app.config["DELIVERY_STATUS_BATCH_SIZE"], app.config["DELIVERY_STATUS_FLUSH_MS"]
+    )
+    app.extensions["storage"] = storage
+
+
+__all__ = [
+    'storage', 'message_log', 'delivery_status', 'create_storage', 'init_storage',
+    'StorageProxy', 'JsonStorage', 'DatabaseManager', 'MessageLogBuffer', 'DeliveryStatusBuffer',
+]
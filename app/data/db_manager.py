@@ -1,68 +1,239 @@
+import atexit
+import json
+import os
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
+from .migrations import run_migrations
+from .write_behind import DELIVERY_STATUS_RANK
+
+MAX_ROWID = 2 ** 63 - 1
+
+# Statements are kept as constants so each persistent connection compiles them
+# once and reuses them from sqlite3's per-connection statement cache.
+INSERT_TRADE = '''
+    INSERT INTO trades (person_name, product_name, quantity, price, wa_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+UPDATE_TRADE_STATUS = '''
+    UPDATE trades
+    SET status = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+SELECT_TRADE = 'SELECT * FROM trades WHERE id = ?'
+SELECT_TRADES = 'SELECT * FROM trades ORDER BY created_at DESC, id DESC'
+SELECT_TRADES_BY_STATUS = 'SELECT * FROM trades WHERE status = ? ORDER BY created_at DESC, id DESC'
+SELECT_TRADES_PAGE = 'SELECT * FROM trades WHERE id < ? ORDER BY id DESC LIMIT ?'
+SELECT_TRADES_PAGE_BY_STATUS = 'SELECT * FROM trades WHERE status = ? AND id < ? ORDER BY id DESC LIMIT ?'
+SELECT_TRADES_FOR = 'SELECT * FROM trades WHERE wa_id = ? AND id < ? ORDER BY id DESC LIMIT ?'
+SELECT_TRADES_FOR_BY_STATUS = '''
+    SELECT * FROM trades
+    WHERE wa_id = ? AND status = ? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+INSERT_MESSAGE = '''
+    INSERT INTO messages (wa_id, message_type, message_content, direction, wa_message_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+# Only moves a message forward through sent -> delivered -> read (-> failed)
+UPDATE_MESSAGE_STATUS = '''
+    UPDATE messages
+    SET status = :status
+    WHERE wa_message_id = :wa_message_id
+      AND CASE status {rank_cases} ELSE 0 END < :rank
+'''.format(rank_cases=" ".join(
+    f"WHEN '{status}' THEN {rank}" for status, rank in DELIVERY_STATUS_RANK.items()
+))
+SELECT_MESSAGE_HISTORY = '''
+    SELECT * FROM messages
+    WHERE wa_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+INSERT_PROCESSED_MESSAGE = 'INSERT OR IGNORE INTO processed_messages (message_id, processed_at) VALUES (?, ?)'
+DELETE_PROCESSED_MESSAGES_BEFORE = 'DELETE FROM processed_messages WHERE processed_at < ?'
+INSERT_BROADCAST = 'INSERT INTO broadcasts (builder, params) VALUES (?, ?)'
+INSERT_BROADCAST_RECIPIENT = '''
+    INSERT OR IGNORE INTO broadcast_recipients (broadcast_id, seq, recipient, updated_at)
+    VALUES (?, ?, ?, ?)
+'''
+UPDATE_BROADCAST_STATUS = '''
+    UPDATE broadcasts
+    SET status = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+SELECT_BROADCAST = 'SELECT * FROM broadcasts WHERE id = ?'
+SELECT_BROADCASTS = 'SELECT * FROM broadcasts ORDER BY id DESC'
+SELECT_BROADCASTS_BY_STATUS = 'SELECT * FROM broadcasts WHERE status = ? ORDER BY id DESC'
+COUNT_BROADCAST_RECIPIENTS = '''
+    SELECT status, COUNT(*) FROM broadcast_recipients
+    WHERE broadcast_id = ?
+    GROUP BY status
+'''
+SELECT_PENDING_BROADCAST_RECIPIENTS = '''
+    SELECT seq, recipient FROM broadcast_recipients
+    WHERE broadcast_id = ? AND status = 'pending'
+    ORDER BY seq
+    LIMIT ?
+'''
+UPDATE_BROADCAST_RECIPIENT_SENDING = '''
+    UPDATE broadcast_recipients
+    SET status = 'sending', updated_at = ?
+    WHERE broadcast_id = ? AND seq = ?
+'''
+UPDATE_BROADCAST_RECIPIENT = '''
+    UPDATE broadcast_recipients
+    SET status = ?, wa_message_id = ?, error = ?, updated_at = ?
+    WHERE broadcast_id = ? AND recipient = ?
+'''
+UPDATE_BROADCAST_INTERRUPTED = '''
+    UPDATE broadcast_recipients
+    SET status = 'unknown', updated_at = ?
+    WHERE broadcast_id = ? AND status = 'sending'
+'''
+SELECT_BROADCAST_RECIPIENTS = '''
+    SELECT recipient, status, wa_message_id, error FROM broadcast_recipients
+    WHERE broadcast_id = ?
+    ORDER BY seq
+'''
+SELECT_BROADCAST_RECIPIENTS_BY_STATUS = '''
+    SELECT recipient, status, wa_message_id, error FROM broadcast_recipients
+    WHERE broadcast_id = ? AND status = ?
+    ORDER BY seq
+'''
+INSERT_OUTBOUND = '''
+    INSERT INTO outbound_queue (recipient, payload, priority, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?)
+'''
+# The oldest due message of each recipient that has none leased, so one
+# recipient's messages go out one at a time and in order, across processes
+SELECT_DUE_OUTBOUND = '''
+    SELECT id, recipient, payload, priority, attempts, created_at FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY recipient ORDER BY id) AS position
+        FROM outbound_queue
+        WHERE next_attempt_at <= :now
+          AND recipient NOT IN (SELECT recipient FROM outbound_queue WHERE leased_until > :now)
+    )
+    WHERE position = 1
+    ORDER BY priority, id
+    LIMIT :limit
+'''
+# A claimed message is leased by pushing its next attempt into the future; if
+# the sender dies, the message simply becomes due again
+LEASE_OUTBOUND = 'UPDATE outbound_queue SET next_attempt_at = ?, leased_until = ? WHERE id = ?'
+# Only while still leased, so a renewal racing a reschedule does not undo it
+RENEW_OUTBOUND_LEASE = '''
+    UPDATE outbound_queue
+    SET next_attempt_at = ?, leased_until = ?
+    WHERE id = ? AND leased_until IS NOT NULL
+'''
+DELETE_OUTBOUND = 'DELETE FROM outbound_queue WHERE id = ?'
+RESCHEDULE_OUTBOUND = '''
+    UPDATE outbound_queue
+    SET attempts = ?, next_attempt_at = ?, last_error = ?, leased_until = NULL
+    WHERE id = ?
+'''
+INSERT_DEAD_LETTER = '''
+    INSERT INTO dead_letters (recipient, payload, priority, attempts, last_error, created_at, failed_at)
+    SELECT recipient, payload, priority, ?, ?, created_at, ? FROM outbound_queue WHERE id = ?
+'''
+SELECT_NEXT_OUTBOUND_DUE = 'SELECT MIN(next_attempt_at) FROM outbound_queue'
+COUNT_OUTBOUND = 'SELECT COUNT(*), COALESCE(SUM(next_attempt_at <= ?), 0) FROM outbound_queue'
+COUNT_DEAD_LETTERS = 'SELECT COUNT(*) FROM dead_letters'
+SELECT_DEAD_LETTERS = 'SELECT * FROM dead_letters ORDER BY id DESC LIMIT ?'
+REPLAY_DEAD_LETTER = '''
+    INSERT INTO outbound_queue (recipient, payload, priority, next_attempt_at, created_at)
+    SELECT recipient, payload, priority, ?, created_at FROM dead_letters WHERE id = ?
+'''
+DELETE_DEAD_LETTER = 'DELETE FROM dead_letters WHERE id = ?'
+SELECT_DEAD_LETTER_IDS = 'SELECT id FROM dead_letters ORDER BY id'
+
+
 class DatabaseManager:
-    def __init__(self, db_path="app/data/development.db"):
-        """Initialize the database manager with the path to the SQLite database."""
+    def __init__(self, db_path="app/data/development.db", busy_timeout=5.0, cached_statements=128):
+        """
+        Initialize the database manager with the path to the SQLite database.
+
+        Each thread keeps one persistent connection in WAL mode with
+        synchronous=NORMAL, so readers never block the writer and a commit
+        costs a WAL append rather than a journal rewrite plus fsync.
+        """
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._pid = os.getpid()
         self._ensure_db_directory()
         self._init_db()
+        atexit.register(self.close)
 
     def _ensure_db_directory(self):
         """Ensure the database directory exists."""
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
 
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            # Only the owning thread uses it; close() may run on another thread
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def _get_connection(self):
+        """Return this thread's connection, opening it on first use."""
+        if self._pid != os.getpid():
+            # Connections must not cross a fork; start over in the child.
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._connections = []
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
     def _init_db(self):
-        """Initialize the database with required tables."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Create trades table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS trades (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        person_name TEXT NOT NULL,
-                        product_name TEXT NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        price REAL NOT NULL,
-                        status TEXT DEFAULT 'pending',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Create messages table for tracking WhatsApp messages
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        wa_id TEXT NOT NULL,
-                        message_type TEXT NOT NULL,
-                        message_content TEXT,
-                        direction TEXT NOT NULL,
-                        status TEXT DEFAULT 'sent',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                conn.commit()
-                logging.info("Database initialized successfully")
+        """Bring the database schema up to date by running pending migrations."""
+        try:
+            version = run_migrations(self._get_connection())
+            logging.info(f"Database initialized successfully (schema version {version})")
         except sqlite3.Error as e:
             logging.error(f"Database initialization error: {e}")
             raise
 
-    def add_trade(self, person_name, product_name, quantity, price):
-        """Add a new trade to the database."""
+    def close(self):
+        """Close every connection opened by this process."""
+        if self._pid != os.getpid():
+            return
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
+    def add_trade(self, person_name, product_name, quantity, price, wa_id=None):
+        """Add a new trade to the database, recording the submitter's WhatsApp ID."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO trades (person_name, product_name, quantity, price)
-                    VALUES (?, ?, ?, ?)
-                ''', (person_name, product_name, quantity, price))
-                conn.commit()
+            with self._get_connection() as conn:
+                cursor = conn.execute(INSERT_TRADE, (person_name, product_name, quantity, price, wa_id))
                 return cursor.lastrowid
         except sqlite3.Error as e:
             logging.error(f"Error adding trade: {e}")
@@ -71,14 +242,8 @@ class DatabaseManager:
     def update_trade_status(self, trade_id, status):
         """Update the status of a trade."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE trades 
-                    SET status = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (status, trade_id))
-                conn.commit()
+            with self._get_connection() as conn:
+                cursor = conn.execute(UPDATE_TRADE_STATUS, (status, trade_id))
                 return cursor.rowcount > 0
         except sqlite3.Error as e:
             logging.error(f"Error updating trade status: {e}")
@@ -87,10 +252,8 @@ class DatabaseManager:
     def get_trade(self, trade_id):
         """Get a trade by ID."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-                return cursor.fetchone()
+            row = self._get_connection().execute(SELECT_TRADE, (trade_id,)).fetchone()
+            return dict(row) if row else None
         except sqlite3.Error as e:
             logging.error(f"Error getting trade: {e}")
             raise
@@ -98,57 +261,408 @@ class DatabaseManager:
     def get_all_trades(self, status=None):
         """Get all trades, optionally filtered by status."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                if status:
-                    cursor.execute('SELECT * FROM trades WHERE status = ? ORDER BY created_at DESC', (status,))
-                else:
-                    cursor.execute('SELECT * FROM trades ORDER BY created_at DESC')
-                return cursor.fetchall()
+            conn = self._get_connection()
+            if status:
+                rows = conn.execute(SELECT_TRADES_BY_STATUS, (status,)).fetchall()
+            else:
+                rows = conn.execute(SELECT_TRADES).fetchall()
+            return [dict(row) for row in rows]
         except sqlite3.Error as e:
             logging.error(f"Error getting trades: {e}")
             raise
 
-    def log_message(self, wa_id, message_type, message_content, direction):
-        """Log a WhatsApp message."""
+    def _page(self, sql, params, limit):
+        # Fetch one extra row to learn whether another page follows
+        rows = self._get_connection().execute(sql, (*params, limit + 1)).fetchall()
+        trades = [dict(row) for row in rows[:limit]]
+        next_cursor = trades[-1]["id"] if len(rows) > limit else None
+        return trades, next_cursor
+
+    def get_trades_page(self, status=None, limit=9, cursor=None):
+        """
+        Get one page of trades, newest first, using keyset pagination.
+
+        `cursor` is the id of the last trade on the previous page. Returns
+        (trades, next_cursor); next_cursor is None on the last page.
+        """
+        before_id = int(cursor) if cursor is not None else MAX_ROWID
+        try:
+            if status:
+                return self._page(SELECT_TRADES_PAGE_BY_STATUS, (status, before_id), limit)
+            return self._page(SELECT_TRADES_PAGE, (before_id,), limit)
+        except sqlite3.Error as e:
+            logging.error(f"Error getting trades page: {e}")
+            raise
+
+    def get_trades_for(self, wa_id, status=None, limit=9, cursor=None):
+        """
+        Get one page of the trades submitted by `wa_id`, newest first.
+
+        Same cursor contract as `get_trades_page`.
+        """
+        before_id = int(cursor) if cursor is not None else MAX_ROWID
+        try:
+            if status:
+                return self._page(SELECT_TRADES_FOR_BY_STATUS, (wa_id, status, before_id), limit)
+            return self._page(SELECT_TRADES_FOR, (wa_id, before_id), limit)
+        except sqlite3.Error as e:
+            logging.error(f"Error getting trades for {wa_id}: {e}")
+            raise
+
+    def log_message(self, wa_id, message_type, message_content, direction, wa_message_id=None):
+        """Log a WhatsApp message, optionally with its WhatsApp message id (wamid)."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO messages (wa_id, message_type, message_content, direction)
-                    VALUES (?, ?, ?, ?)
-                ''', (wa_id, message_type, message_content, direction))
-                conn.commit()
+            with self._get_connection() as conn:
+                cursor = conn.execute(INSERT_MESSAGE, (wa_id, message_type, message_content, direction, wa_message_id))
                 return cursor.lastrowid
         except sqlite3.Error as e:
             logging.error(f"Error logging message: {e}")
             raise
 
+    def log_messages(self, messages):
+        """
+        Log several WhatsApp messages in one transaction.
+
+        `messages` is a list of (wa_id, message_type, message_content, direction,
+        wa_message_id) tuples. Returns the number of messages written.
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(INSERT_MESSAGE, messages)
+                return len(messages)
+        except sqlite3.Error as e:
+            logging.error(f"Error logging messages: {e}")
+            raise
+
+    def update_message_statuses(self, statuses):
+        """
+        Apply delivery statuses in one transaction.
+
+        `statuses` maps wamid to its latest status. A status never moves a
+        message backwards (e.g. "delivered" arriving after "read").
+        """
+        params = [
+            {"status": status, "wa_message_id": wa_message_id, "rank": DELIVERY_STATUS_RANK.get(status, 0)}
+            for wa_message_id, status in statuses.items()
+        ]
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(UPDATE_MESSAGE_STATUS, params)
+                return len(params)
+        except sqlite3.Error as e:
+            logging.error(f"Error updating message statuses: {e}")
+            raise
+
     def get_message_history(self, wa_id, limit=50):
         """Get message history for a specific WhatsApp ID."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM messages 
-                    WHERE wa_id = ? 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                ''', (wa_id, limit))
-                return cursor.fetchall()
+            rows = self._get_connection().execute(SELECT_MESSAGE_HISTORY, (wa_id, limit)).fetchall()
+            return [dict(row) for row in rows]
         except sqlite3.Error as e:
             logging.error(f"Error getting message history: {e}")
             raise
 
-    def clear_development_data(self):
+    def mark_message_processed(self, message_id):
+        """
+        Record a webhook message id as handled.
+
+        Returns False if it was already recorded, i.e. this is a redelivery.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(INSERT_PROCESSED_MESSAGE, (message_id, time.time()))
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error marking message processed: {e}")
+            raise
+
+    def prune_processed_messages(self, max_age_seconds):
+        """Forget processed message ids older than `max_age_seconds`."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(DELETE_PROCESSED_MESSAGES_BEFORE, (time.time() - max_age_seconds,)).rowcount
+        except sqlite3.Error as e:
+            logging.error(f"Error pruning processed messages: {e}")
+            raise
+
+    def create_broadcast(self, builder, params, recipients):
+        """
+        Record a broadcast job and its recipients, all pending.
+
+        Duplicate recipients are kept once. Returns the broadcast id.
+        """
+        now = time.time()
+        try:
+            with self._get_connection() as conn:
+                broadcast_id = conn.execute(INSERT_BROADCAST, (builder, json.dumps(params))).lastrowid
+                conn.executemany(
+                    INSERT_BROADCAST_RECIPIENT,
+                    ((broadcast_id, seq, recipient, now) for seq, recipient in enumerate(recipients)),
+                )
+                return broadcast_id
+        except sqlite3.Error as e:
+            logging.error(f"Error creating broadcast: {e}")
+            raise
+
+    def claim_broadcast_recipients(self, broadcast_id, limit):
+        """
+        Move up to `limit` pending recipients to "sending" and return them.
+
+        The claim is committed before anything is sent, so a recipient is
+        never handed out twice, even across processes or after a crash.
+        """
+        try:
+            conn = self._get_connection()
+            with conn:
+                # Take the write lock before reading so two claimers cannot
+                # pick the same rows
+                conn.execute('BEGIN IMMEDIATE')
+                rows = conn.execute(SELECT_PENDING_BROADCAST_RECIPIENTS, (broadcast_id, limit)).fetchall()
+                now = time.time()
+                conn.executemany(
+                    UPDATE_BROADCAST_RECIPIENT_SENDING,
+                    [(now, broadcast_id, row["seq"]) for row in rows],
+                )
+                return [row["recipient"] for row in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Error claiming broadcast recipients: {e}")
+            raise
+
+    def record_broadcast_results(self, broadcast_id, results):
+        """
+        Store per-recipient outcomes in one transaction.
+
+        `results` is a list of (recipient, status, wa_message_id, error)
+        tuples. Returns the number of recipients updated.
+        """
+        now = time.time()
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    UPDATE_BROADCAST_RECIPIENT,
+                    [(status, wa_message_id, error, now, broadcast_id, recipient)
+                     for recipient, status, wa_message_id, error in results],
+                )
+                return len(results)
+        except sqlite3.Error as e:
+            logging.error(f"Error recording broadcast results: {e}")
+            raise
+
+    def mark_broadcast_interrupted(self, broadcast_id):
+        """
+        Mark recipients left in "sending" by a crash as "unknown".
+
+        They may or may not have received the message, so they are not sent
+        again. Returns the number of recipients marked.
+        """
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(UPDATE_BROADCAST_INTERRUPTED, (time.time(), broadcast_id)).rowcount
+        except sqlite3.Error as e:
+            logging.error(f"Error marking broadcast interrupted: {e}")
+            raise
+
+    def update_broadcast_status(self, broadcast_id, status):
+        """Update the status of a broadcast job."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(UPDATE_BROADCAST_STATUS, (status, broadcast_id)).rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error updating broadcast status: {e}")
+            raise
+
+    def _broadcast(self, conn, row):
+        broadcast = dict(row)
+        broadcast["params"] = json.loads(broadcast["params"]) if broadcast["params"] else {}
+        counts = dict(conn.execute(COUNT_BROADCAST_RECIPIENTS, (broadcast["id"],)).fetchall())
+        broadcast["counts"] = counts
+        broadcast["total"] = sum(counts.values())
+        return broadcast
+
+    def get_broadcast(self, broadcast_id):
+        """Get a broadcast job with its recipient counts per status."""
+        try:
+            conn = self._get_connection()
+            row = conn.execute(SELECT_BROADCAST, (broadcast_id,)).fetchone()
+            return self._broadcast(conn, row) if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Error getting broadcast: {e}")
+            raise
+
+    def get_broadcasts(self, status=None):
+        """Get all broadcast jobs, newest first, optionally filtered by status."""
+        try:
+            conn = self._get_connection()
+            if status:
+                rows = conn.execute(SELECT_BROADCASTS_BY_STATUS, (status,)).fetchall()
+            else:
+                rows = conn.execute(SELECT_BROADCASTS).fetchall()
+            return [self._broadcast(conn, row) for row in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Error getting broadcasts: {e}")
+            raise
+
+    def get_broadcast_recipients(self, broadcast_id, status=None):
+        """Get the recipients of a broadcast with their outcomes, in list order."""
+        try:
+            conn = self._get_connection()
+            if status:
+                rows = conn.execute(SELECT_BROADCAST_RECIPIENTS_BY_STATUS, (broadcast_id, status)).fetchall()
+            else:
+                rows = conn.execute(SELECT_BROADCAST_RECIPIENTS, (broadcast_id,)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Error getting broadcast recipients: {e}")
+            raise
+
+    def enqueue_outbound(self, recipient, payload, priority=0):
+        """Add a message payload to the outbound queue, due now. Returns its id."""
+        now = time.time()
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(INSERT_OUTBOUND, (recipient, payload, priority, now, now)).lastrowid
+        except sqlite3.Error as e:
+            logging.error(f"Error enqueueing outbound message: {e}")
+            raise
+
+    def claim_outbound(self, limit, lease_seconds):
+        """
+        Lease up to `limit` due messages for `lease_seconds` and return them.
+
+        At most one message per recipient is leased at a time: the oldest
+        due one, and none while another of theirs is still leased. Leased
+        messages are not due again until the lease runs out, so other
+        senders skip them; if this one dies mid-send they are retried.
+        """
+        try:
+            conn = self._get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                now = time.time()
+                rows = conn.execute(SELECT_DUE_OUTBOUND, {"now": now, "limit": limit}).fetchall()
+                until = now + lease_seconds
+                conn.executemany(LEASE_OUTBOUND, [(until, until, row["id"]) for row in rows])
+                return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Error claiming outbound messages: {e}")
+            raise
+
+    def renew_outbound_leases(self, message_ids, lease_seconds):
+        """Extend the lease on messages still being sent by `lease_seconds` from now."""
+        until = time.time() + lease_seconds
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(RENEW_OUTBOUND_LEASE, [(until, until, message_id) for message_id in message_ids])
+        except sqlite3.Error as e:
+            logging.error(f"Error renewing outbound leases: {e}")
+            raise
+
+    def delete_outbound(self, message_id):
+        """Remove a delivered message from the outbound queue."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(DELETE_OUTBOUND, (message_id,)).rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting outbound message: {e}")
+            raise
+
+    def reschedule_outbound(self, message_id, attempts, next_attempt_at, error):
+        """Record a failed attempt and when to try the message again."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(RESCHEDULE_OUTBOUND, (attempts, next_attempt_at, error, message_id)).rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error rescheduling outbound message: {e}")
+            raise
+
+    def dead_letter_outbound(self, message_id, attempts, error):
+        """Move a message that will not be retried to the dead letters."""
+        try:
+            with self._get_connection() as conn:
+                conn.execute(INSERT_DEAD_LETTER, (attempts, error, time.time(), message_id))
+                return conn.execute(DELETE_OUTBOUND, (message_id,)).rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error dead-lettering outbound message: {e}")
+            raise
+
+    def get_next_outbound_due(self):
+        """Return when the next queued message is due, or None if the queue is empty."""
+        try:
+            return self._get_connection().execute(SELECT_NEXT_OUTBOUND_DUE).fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Error getting next outbound message: {e}")
+            raise
+
+    def get_outbound_counts(self):
+        """Count queued messages, those due now, and dead letters."""
+        try:
+            conn = self._get_connection()
+            queued, due = conn.execute(COUNT_OUTBOUND, (time.time(),)).fetchone()
+            dead_letters = conn.execute(COUNT_DEAD_LETTERS).fetchone()[0]
+            return {"queued": queued, "due": due, "dead_letters": dead_letters}
+        except sqlite3.Error as e:
+            logging.error(f"Error counting outbound messages: {e}")
+            raise
+
+    def get_dead_letters(self, limit=50):
+        """Get the most recent dead letters, newest first."""
+        try:
+            rows = self._get_connection().execute(SELECT_DEAD_LETTERS, (limit,)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Error getting dead letters: {e}")
+            raise
+
+    def replay_dead_letters(self, dead_letter_ids=None):
+        """
+        Put dead letters back on the outbound queue with a fresh set of attempts.
+
+        Replays every dead letter when no ids are given. Returns the number
+        of messages requeued.
+        """
+        try:
+            conn = self._get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if dead_letter_ids is None:
+                    dead_letter_ids = [row[0] for row in conn.execute(SELECT_DEAD_LETTER_IDS)]
+                now = time.time()
+                replayed = 0
+                for dead_letter_id in dead_letter_ids:
+                    if conn.execute(REPLAY_DEAD_LETTER, (now, dead_letter_id)).rowcount:
+                        conn.execute(DELETE_DEAD_LETTER, (dead_letter_id,))
+                        replayed += 1
+                return replayed
+        except sqlite3.Error as e:
+            logging.error(f"Error replaying dead letters: {e}")
+            raise
+
+    def delete_dead_letters(self, dead_letter_ids):
+        """Discard dead letters for good. Returns the number deleted."""
+        try:
+            with self._get_connection() as conn:
+                return sum(
+                    conn.execute(DELETE_DEAD_LETTER, (dead_letter_id,)).rowcount for dead_letter_id in dead_letter_ids
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting dead letters: {e}")
+            raise
+
+    def clear_data(self):
         """Clear all data from the database (for development purposes only)."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM trades')
-                cursor.execute('DELETE FROM messages')
-                conn.commit()
+            with self._get_connection() as conn:
+                conn.execute('DELETE FROM trades')
+                conn.execute('DELETE FROM messages')
+                conn.execute('DELETE FROM broadcast_recipients')
+                conn.execute('DELETE FROM broadcasts')
+                conn.execute('DELETE FROM outbound_queue')
+                conn.execute('DELETE FROM dead_letters')
                 logging.info("Development data cleared successfully")
+                return True
         except sqlite3.Error as e:
             logging.error(f"Error clearing development data: {e}")
-            raise 
\ No newline at end of file
+            raise
+
+    # Kept for callers written against the original DatabaseManager API
+    clear_development_data = clear_data
@@ -1,20 +1,62 @@
+import atexit
+import bisect
+import itertools
 import json
 import os
 import logging
+import shutil
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 
+from .write_behind import DELIVERY_STATUS_RANK
+
+FSYNC_ALWAYS = "always"
+FSYNC_BATCH = "batch"
+FSYNC_NONE = "none"
+
+
 class JsonStorage:
-    def __init__(self, data_file="app/data/development_data.json"):
-        """Initialize the JSON storage with the path to the data file."""
+    def __init__(self, data_file="app/data/development_data.json", mode="snapshot",
+                 fsync=FSYNC_BATCH, compact_bytes=4 * 1024 * 1024,
+                 fsync_batch_size=100, fsync_interval=1.0):
+        """
+        Initialize the JSON storage with the path to the data file.
+
+        In "snapshot" mode every mutation rewrites the whole data file. In "log"
+        mode each mutation appends one JSON-lines record to `<data_file>.log`,
+        the log is replayed on startup, and a background compaction folds it
+        back into the data file once it grows past `compact_bytes`.
+        """
         self.data_file = data_file
+        self.log_file = data_file + ".log"
+        self.mode = mode
+        self.fsync = fsync
+        self.compact_bytes = compact_bytes
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._log = None
+        self._log_bytes = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._compacting = False
         self._ensure_data_directory()
         self.data = self._load_data()
+        self._build_indexes()
+        if self.mode == "log":
+            # A leftover .compacting file means we stopped mid-compaction; its
+            # records precede the live log and replaying them is idempotent.
+            for path in (self.log_file + ".compacting", self.log_file):
+                self._replay(path)
+            self._open_log()
+            atexit.register(self.close)
 
     def _ensure_data_directory(self):
         """Ensure the data directory exists."""
         Path(self.data_file).parent.mkdir(parents=True, exist_ok=True)
-        
+
         # Create the file if it doesn't exist
         if not os.path.exists(self.data_file):
             self._save_data({"trades": [], "messages": []})
@@ -28,11 +70,169 @@ class JsonStorage:
             # Return default structure if file doesn't exist or is invalid
             return {"trades": [], "messages": []}
 
+    def _build_indexes(self):
+        """
+        Rebuild the in-memory lookup indexes from `self.data`.
+
+        `_trades_by_id` maps trade id to trade, `_trade_ids_by_status` maps a
+        status to the sorted ids of the trades currently in it,
+        `_trade_ids_by_wa_id` holds each submitter's trade ids in order, and
+        `_messages_by_wa_id` holds each contact's messages in insertion
+        (= creation) order, and `_messages_by_wamid` maps WhatsApp message
+        ids to messages for status callbacks. Broadcasts are indexed by id,
+        with each one's recipient rows by recipient and its pending recipients
+        in claim order.
+        """
+        self._trades_by_id = {}
+        self._trade_ids_by_status = {}
+        self._trade_ids_by_wa_id = {}
+        self._messages_by_wa_id = {}
+        self._messages_by_wamid = {}
+        for trade in self.data["trades"]:
+            self._index_trade(trade)
+            self._index_trade_owner(trade)
+        for message in self.data["messages"]:
+            self._index_message(message)
+        self._broadcasts_by_id = {}
+        self._broadcast_rows = {}
+        self._broadcast_pending = {}
+        for broadcast in self.data.get("broadcasts", []):
+            self._index_broadcast(broadcast)
+
+    def _index_broadcast(self, broadcast):
+        self._broadcasts_by_id[broadcast["id"]] = broadcast
+        self._broadcast_rows[broadcast["id"]] = {row["recipient"]: row for row in broadcast["recipients"]}
+        # dict as an ordered set: claims take from the front
+        self._broadcast_pending[broadcast["id"]] = dict.fromkeys(
+            row["recipient"] for row in broadcast["recipients"] if row["status"] == "pending"
+        )
+
+    def _index_message(self, message):
+        self._messages_by_wa_id.setdefault(message["wa_id"], []).append(message)
+        if message.get("wa_message_id"):
+            self._messages_by_wamid[message["wa_message_id"]] = message
+
+    def _index_trade(self, trade):
+        self._trades_by_id[trade["id"]] = trade
+        bisect.insort(self._trade_ids_by_status.setdefault(trade["status"], []), trade["id"])
+
+    def _index_trade_owner(self, trade):
+        # Ids are assigned in increasing order, so appending keeps these sorted
+        if trade.get("wa_id") is not None:
+            self._trade_ids_by_wa_id.setdefault(trade["wa_id"], []).append(trade["id"])
+
+    def _unindex_trade_status(self, trade):
+        ids = self._trade_ids_by_status[trade["status"]]
+        del ids[bisect.bisect_left(ids, trade["id"])]
+
+    @staticmethod
+    def _trade_key(trade_id):
+        """Normalize a trade id; list reply ids carry it as a string."""
+        try:
+            return int(trade_id)
+        except (TypeError, ValueError):
+            return trade_id
+
+    def _replay(self, path):
+        """Apply every record in a JSON-lines log file."""
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append
+                        logging.warning(f"Skipping corrupt record in {path}")
+                        continue
+                    self._apply(record)
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, record):
+        """
+        Apply a single mutation record to the data and its indexes.
+
+        Used both for live mutations and for log replay. Ids are sequential, so
+        re-applying a record that is already reflected is a no-op.
+        """
+        op = record["op"]
+        if op == "add_trade":
+            trade = record["trade"]
+            if trade["id"] not in self._trades_by_id:
+                self.data["trades"].append(trade)
+                self._index_trade(trade)
+                self._index_trade_owner(trade)
+        elif op == "update_trade":
+            trade = self._trades_by_id.get(record["id"])
+            if trade is not None:
+                self._unindex_trade_status(trade)
+                trade["status"] = record["status"]
+                trade["updated_at"] = record["updated_at"]
+                self._index_trade(trade)
+        elif op == "log_message":
+            message = record["message"]
+            if message["id"] > len(self.data["messages"]):
+                self.data["messages"].append(message)
+                self._index_message(message)
+        elif op == "update_statuses":
+            for wa_message_id, status in record["statuses"].items():
+                message = self._messages_by_wamid.get(wa_message_id)
+                if message is not None and (
+                    DELIVERY_STATUS_RANK.get(status, 0) > DELIVERY_STATUS_RANK.get(message["status"], 0)
+                ):
+                    message["status"] = status
+        elif op == "mark_processed":
+            self.data.setdefault("processed_messages", {})[record["message_id"]] = record["processed_at"]
+        elif op == "prune_processed":
+            processed = self.data.get("processed_messages", {})
+            for message_id in [m for m, at in processed.items() if at < record["before"]]:
+                del processed[message_id]
+        elif op == "create_broadcast":
+            broadcast = record["broadcast"]
+            if broadcast["id"] not in self._broadcasts_by_id:
+                self.data.setdefault("broadcasts", []).append(broadcast)
+                self._index_broadcast(broadcast)
+        elif op == "claim_broadcast":
+            rows = self._broadcast_rows.get(record["id"], {})
+            pending = self._broadcast_pending.get(record["id"], {})
+            for recipient in record["recipients"]:
+                rows[recipient]["status"] = "sending"
+                rows[recipient]["updated_at"] = record["at"]
+                pending.pop(recipient, None)
+        elif op == "broadcast_results":
+            rows = self._broadcast_rows.get(record["id"], {})
+            pending = self._broadcast_pending.get(record["id"], {})
+            for recipient, status, wa_message_id, error in record["results"]:
+                row = rows.get(recipient)
+                if row is None:
+                    continue
+                row.update(status=status, wa_message_id=wa_message_id, error=error, updated_at=record["at"])
+                if status == "pending":
+                    pending[recipient] = None
+                else:
+                    pending.pop(recipient, None)
+        elif op == "broadcast_interrupted":
+            for row in self._broadcast_rows.get(record["id"], {}).values():
+                if row["status"] == "sending":
+                    row["status"] = "unknown"
+                    row["updated_at"] = record["at"]
+        elif op == "update_broadcast":
+            broadcast = self._broadcasts_by_id.get(record["id"])
+            if broadcast is not None:
+                broadcast["status"] = record["status"]
+                broadcast["updated_at"] = record["updated_at"]
+        elif op == "clear":
+            self.data = {"trades": [], "messages": []}
+            self._build_indexes()
+
     def _save_data(self, data=None):
         """Save data to the JSON file."""
         if data is None:
             data = self.data
-            
+
         try:
             with open(self.data_file, 'w') as f:
                 json.dump(data, f, indent=2)
@@ -41,50 +241,182 @@ class JsonStorage:
             logging.error(f"Error saving data: {e}")
             return False
 
-    def add_trade(self, person_name, product_name, quantity, price):
-        """Add a new trade to the storage."""
-        trade = {
-            "id": len(self.data["trades"]) + 1,
-            "person_name": person_name,
-            "product_name": product_name,
-            "quantity": quantity,
-            "price": price,
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-        
-        self.data["trades"].append(trade)
-        self._save_data()
-        return trade["id"]
+    def _open_log(self):
+        # Binary, so tell() and the counter in _persist are both in bytes
+        self._log = open(self.log_file, 'ab')
+        self._log_bytes = self._log.tell()
+
+    def _persist(self, *records):
+        """Make mutations durable according to the storage mode. Caller holds the lock."""
+        if self.mode != "log":
+            return self._save_data()
+
+        try:
+            lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+            self._log.write(lines)
+            self._log.flush()
+            self._log_bytes += len(lines)
+            self._unsynced += len(records)
+            if self.fsync == FSYNC_ALWAYS or (
+                self.fsync == FSYNC_BATCH
+                and (self._unsynced >= self.fsync_batch_size
+                     or time.monotonic() - self._last_fsync >= self.fsync_interval)
+            ):
+                self._sync()
+        except Exception as e:
+            logging.error(f"Error appending to data log: {e}")
+            return False
+
+        if self._log_bytes >= self.compact_bytes and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, name="json-storage-compact", daemon=True).start()
+        return True
+
+    def _sync(self):
+        os.fsync(self._log.fileno())
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def compact(self):
+        """Fold the mutation log into a fresh snapshot of the data file."""
+        if self.mode != "log":
+            return
+        compacting_file = self.log_file + ".compacting"
+        try:
+            # Only the in-memory serialization and the log swap happen under
+            # the lock; writing the snapshot does not block writers.
+            with self._lock:
+                snapshot = json.dumps(self.data)
+                self._sync()
+                self._log.close()
+                try:
+                    if os.path.exists(compacting_file):
+                        # An earlier compaction failed before its snapshot
+                        # landed; its records are still needed, so add these
+                        # to them rather than replacing them
+                        self._append_file(self.log_file, compacting_file)
+                        os.remove(self.log_file)
+                    else:
+                        os.replace(self.log_file, compacting_file)
+                finally:
+                    # A fresh log after the swap, or the same one if it failed
+                    self._open_log()
+
+            tmp_file = self.data_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(snapshot)
+                f.flush()
+                if self.fsync != FSYNC_NONE:
+                    os.fsync(f.fileno())
+            os.replace(tmp_file, self.data_file)
+            os.remove(compacting_file)
+            logging.info("Compacted data log into snapshot")
+        except Exception as e:
+            logging.error(f"Error compacting data log: {e}")
+        finally:
+            self._compacting = False
+
+    def _append_file(self, source, target):
+        with open(source, 'rb') as src, open(target, 'ab') as dst:
+            if dst.tell():
+                # Keep a torn final line from swallowing the first record
+                dst.write(b"\n")
+            shutil.copyfileobj(src, dst)
+            dst.flush()
+            if self.fsync != FSYNC_NONE:
+                os.fsync(dst.fileno())
+
+    def close(self):
+        """Flush and fsync the mutation log (log mode only)."""
+        with self._lock:
+            if self._log is not None and not self._log.closed:
+                if self.fsync != FSYNC_NONE:
+                    self._sync()
+                self._log.close()
+
+    def add_trade(self, person_name, product_name, quantity, price, wa_id=None):
+        """Add a new trade to the storage, recording the submitter's WhatsApp ID."""
+        with self._lock:
+            trade = {
+                "id": len(self.data["trades"]) + 1,
+                "wa_id": wa_id,
+                "person_name": person_name,
+                "product_name": product_name,
+                "quantity": quantity,
+                "price": price,
+                "status": "pending",
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat()
+            }
+
+            record = {"op": "add_trade", "trade": trade}
+            self._apply(record)
+            self._persist(record)
+            return trade["id"]
 
     def update_trade_status(self, trade_id, status):
         """Update the status of a trade."""
-        for trade in self.data["trades"]:
-            if trade["id"] == trade_id:
-                trade["status"] = status
-                trade["updated_at"] = datetime.now().isoformat()
-                self._save_data()
-                return True
-        return False
+        with self._lock:
+            trade = self._trades_by_id.get(self._trade_key(trade_id))
+            if trade is None:
+                return False
+
+            record = {
+                "op": "update_trade",
+                "id": trade["id"],
+                "status": status,
+                "updated_at": datetime.now().isoformat(),
+            }
+            self._apply(record)
+            self._persist(record)
+            return True
 
     def get_trade(self, trade_id):
         """Get a trade by ID."""
-        for trade in self.data["trades"]:
-            if trade["id"] == trade_id:
-                return trade
-        return None
+        return self._trades_by_id.get(self._trade_key(trade_id))
 
     def get_all_trades(self, status=None):
         """Get all trades, optionally filtered by status."""
         if status:
-            return [trade for trade in self.data["trades"] if trade["status"] == status]
+            return [self._trades_by_id[trade_id] for trade_id in self._trade_ids_by_status.get(status, [])]
         return self.data["trades"]
 
-    def log_message(self, wa_id, message_type, message_content, direction):
-        """Log a WhatsApp message."""
-        message = {
+    def _page(self, ids, limit, cursor):
+        """Walk a sorted id list backwards from `cursor`, returning (trades, next_cursor)."""
+        end = len(ids) if cursor is None else bisect.bisect_left(ids, self._trade_key(cursor))
+        page = [self._trades_by_id[ids[i]] for i in range(end - 1, max(end - limit, 0) - 1, -1)]
+        next_cursor = page[-1]["id"] if page and end > limit else None
+        return page, next_cursor
+
+    def get_trades_page(self, status=None, limit=9, cursor=None):
+        """
+        Get one page of trades, newest first, using keyset pagination.
+
+        `cursor` is the id of the last trade on the previous page. Returns
+        (trades, next_cursor); next_cursor is None on the last page.
+        """
+        if status:
+            ids = self._trade_ids_by_status.get(status, [])
+        else:
+            # Trade ids are 1..n in list order
+            ids = range(1, len(self.data["trades"]) + 1)
+        return self._page(ids, limit, cursor)
+
+    def get_trades_for(self, wa_id, status=None, limit=9, cursor=None):
+        """
+        Get one page of the trades submitted by `wa_id`, newest first.
+
+        Same cursor contract as `get_trades_page`.
+        """
+        ids = self._trade_ids_by_wa_id.get(wa_id, [])
+        if status:
+            ids = [trade_id for trade_id in ids if self._trades_by_id[trade_id]["status"] == status]
+        return self._page(ids, limit, cursor)
+
+    def _new_message(self, wa_id, message_type, message_content, direction, wa_message_id=None):
+        return {
             "id": len(self.data["messages"]) + 1,
+            "wa_message_id": wa_message_id,
             "wa_id": wa_id,
             "message_type": message_type,
             "message_content": message_content,
@@ -92,19 +424,240 @@ class JsonStorage:
             "status": "sent",
             "created_at": datetime.now().isoformat()
         }
-        
-        self.data["messages"].append(message)
-        self._save_data()
-        return message["id"]
+
+    def log_message(self, wa_id, message_type, message_content, direction, wa_message_id=None):
+        """Log a WhatsApp message, optionally with its WhatsApp message id (wamid)."""
+        with self._lock:
+            message = self._new_message(wa_id, message_type, message_content, direction, wa_message_id)
+            self._check_message(message)
+            record = {"op": "log_message", "message": message}
+            self._apply(record)
+            self._persist(record)
+            return message["id"]
+
+    def log_messages(self, messages):
+        """
+        Log several WhatsApp messages with a single write.
+
+        `messages` is a list of (wa_id, message_type, message_content, direction,
+        wa_message_id) tuples. Returns the number of messages written. Raises
+        ValueError for a record that can never be stored and OSError if they
+        cannot be written; either way none of them is logged.
+        """
+        with self._lock:
+            records = []
+            for offset, fields in enumerate(messages):
+                message = self._new_message(*fields)
+                message["id"] += offset
+                self._check_message(message)
+                records.append({"op": "log_message", "message": message})
+            if not records:
+                return 0
+            logged = len(self.data["messages"])
+            try:
+                for record in records:
+                    self._apply(record)
+                if not self._persist(*records):
+                    raise OSError(f"Could not write {len(records)} messages to {self.data_file}")
+            except Exception:
+                # Take them back out so the caller's retry does not log them twice
+                self._discard_messages(logged)
+                raise
+            return len(records)
+
+    @staticmethod
+    def _check_message(message):
+        # Both ids are index keys, and the whole record must serialize
+        if not isinstance(message["wa_id"], str) or not message["wa_id"]:
+            raise ValueError(f"Message wa_id must be a non-empty string, got {message['wa_id']!r}")
+        if message["wa_message_id"] is not None and not isinstance(message["wa_message_id"], str):
+            raise ValueError(f"Message wa_message_id must be a string, got {message['wa_message_id']!r}")
+        try:
+            json.dumps(message)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Message {message['wa_message_id']!r} cannot be stored: {e}") from None
+
+    def _discard_messages(self, logged):
+        """Undo `_apply` for every message after the first `logged`."""
+        for message in reversed(self.data["messages"][logged:]):
+            messages = self._messages_by_wa_id.get(message["wa_id"])
+            if messages and messages[-1] is message:
+                messages.pop()
+            if self._messages_by_wamid.get(message["wa_message_id"]) is message:
+                del self._messages_by_wamid[message["wa_message_id"]]
+        del self.data["messages"][logged:]
+
+    def update_message_statuses(self, statuses):
+        """
+        Apply delivery statuses in one write.
+
+        `statuses` maps wamid to its latest status. A status never moves a
+        message backwards (e.g. "delivered" arriving after "read"). Raises
+        ValueError for a wamid or status that is not a string and OSError if
+        they cannot be written.
+        """
+        for wa_message_id, status in statuses.items():
+            if not isinstance(wa_message_id, str) or not isinstance(status, str):
+                raise ValueError(f"Cannot store delivery status {status!r} for {wa_message_id!r}")
+        with self._lock:
+            record = {"op": "update_statuses", "statuses": statuses}
+            self._apply(record)
+            if not self._persist(record):
+                # Applying them again on retry is harmless; statuses only move forward
+                raise OSError(f"Could not write {len(statuses)} delivery statuses to {self.data_file}")
+            return len(statuses)
 
     def get_message_history(self, wa_id, limit=50):
-        """Get message history for a specific WhatsApp ID."""
-        messages = [msg for msg in self.data["messages"] if msg["wa_id"] == wa_id]
-        return sorted(messages, key=lambda x: x["created_at"], reverse=True)[:limit]
+        """Get message history for a specific WhatsApp ID, newest first."""
+        messages = self._messages_by_wa_id.get(wa_id, [])
+        return messages[:-limit - 1:-1] if limit > 0 else []
+
+    def mark_message_processed(self, message_id):
+        """
+        Record a webhook message id as handled.
+
+        Returns False if it was already recorded, i.e. this is a redelivery.
+        """
+        with self._lock:
+            if message_id in self.data.get("processed_messages", {}):
+                return False
+            record = {"op": "mark_processed", "message_id": message_id, "processed_at": time.time()}
+            self._apply(record)
+            self._persist(record)
+            return True
+
+    def prune_processed_messages(self, max_age_seconds):
+        """Forget processed message ids older than `max_age_seconds`."""
+        with self._lock:
+            record = {"op": "prune_processed", "before": time.time() - max_age_seconds}
+            self._apply(record)
+            self._persist(record)
+
+    def create_broadcast(self, builder, params, recipients):
+        """
+        Record a broadcast job and its recipients, all pending.
+
+        Duplicate recipients are kept once. Returns the broadcast id.
+        """
+        with self._lock:
+            now = datetime.now().isoformat()
+            broadcast = {
+                "id": len(self.data.get("broadcasts", [])) + 1,
+                "builder": builder,
+                "params": params,
+                "status": "pending",
+                "created_at": now,
+                "updated_at": now,
+                "recipients": [
+                    {"recipient": recipient, "status": "pending", "wa_message_id": None,
+                     "error": None, "updated_at": time.time()}
+                    for recipient in dict.fromkeys(recipients)
+                ],
+            }
+            record = {"op": "create_broadcast", "broadcast": broadcast}
+            self._apply(record)
+            self._persist(record)
+            return broadcast["id"]
+
+    def claim_broadcast_recipients(self, broadcast_id, limit):
+        """
+        Move up to `limit` pending recipients to "sending" and return them.
+
+        The claim is persisted before anything is sent, so a recipient is
+        never handed out twice, even after a crash.
+        """
+        with self._lock:
+            pending = self._broadcast_pending.get(broadcast_id, {})
+            recipients = list(itertools.islice(pending, limit))
+            if recipients:
+                record = {"op": "claim_broadcast", "id": broadcast_id, "recipients": recipients, "at": time.time()}
+                self._apply(record)
+                self._persist(record)
+            return recipients
+
+    def record_broadcast_results(self, broadcast_id, results):
+        """
+        Store per-recipient outcomes with a single write.
+
+        `results` is a list of (recipient, status, wa_message_id, error)
+        tuples. Returns the number of recipients updated.
+        """
+        with self._lock:
+            record = {"op": "broadcast_results", "id": broadcast_id,
+                      "results": [list(result) for result in results], "at": time.time()}
+            self._apply(record)
+            self._persist(record)
+            return len(results)
+
+    def mark_broadcast_interrupted(self, broadcast_id):
+        """
+        Mark recipients left in "sending" by a crash as "unknown".
+
+        They may or may not have received the message, so they are not sent
+        again. Returns the number of recipients marked.
+        """
+        with self._lock:
+            count = sum(
+                1 for row in self._broadcast_rows.get(broadcast_id, {}).values() if row["status"] == "sending"
+            )
+            if count:
+                record = {"op": "broadcast_interrupted", "id": broadcast_id, "at": time.time()}
+                self._apply(record)
+                self._persist(record)
+            return count
+
+    def update_broadcast_status(self, broadcast_id, status):
+        """Update the status of a broadcast job."""
+        with self._lock:
+            if broadcast_id not in self._broadcasts_by_id:
+                return False
+            record = {"op": "update_broadcast", "id": broadcast_id, "status": status,
+                      "updated_at": datetime.now().isoformat()}
+            self._apply(record)
+            self._persist(record)
+            return True
+
+    def _broadcast_summary(self, broadcast):
+        summary = {key: value for key, value in broadcast.items() if key != "recipients"}
+        counts = {}
+        for row in broadcast["recipients"]:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        summary["counts"] = counts
+        summary["total"] = len(broadcast["recipients"])
+        return summary
+
+    def get_broadcast(self, broadcast_id):
+        """Get a broadcast job with its recipient counts per status."""
+        with self._lock:
+            broadcast = self._broadcasts_by_id.get(broadcast_id)
+            return self._broadcast_summary(broadcast) if broadcast else None
+
+    def get_broadcasts(self, status=None):
+        """Get all broadcast jobs, newest first, optionally filtered by status."""
+        with self._lock:
+            return [
+                self._broadcast_summary(broadcast)
+                for broadcast in reversed(self.data.get("broadcasts", []))
+                if not status or broadcast["status"] == status
+            ]
+
+    def get_broadcast_recipients(self, broadcast_id, status=None):
+        """Get the recipients of a broadcast with their outcomes, in list order."""
+        with self._lock:
+            broadcast = self._broadcasts_by_id.get(broadcast_id)
+            if broadcast is None:
+                return []
+            return [
+                {key: row[key] for key in ("recipient", "status", "wa_message_id", "error")}
+                for row in broadcast["recipients"]
+                if not status or row["status"] == status
+            ]
 
     def clear_data(self):
         """Clear all data (for development purposes only)."""
-        self.data = {"trades": [], "messages": []}
-        self._save_data()
+        with self._lock:
+            record = {"op": "clear"}
+            self._apply(record)
+            self._persist(record)
         logging.info("Development data cleared successfully")
-        return True 
\ No newline at end of file
+        return True
@@ -0,0 +1,145 @@
+import logging
+
+# Ordered schema migrations for the SQLite backend. The database's
+# PRAGMA user_version records the last one applied, so each runs exactly once,
+# both on fresh databases and on ones created by earlier releases. Append new
+# migrations to the end; never edit one that has shipped.
+MIGRATIONS = [
+    (1, "create trades and messages tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            person_name TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            wa_id TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            message_content TEXT,
+            direction TEXT NOT NULL,
+            status TEXT DEFAULT 'sent',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "index trades by status and messages by wa_id", [
+        'CREATE INDEX IF NOT EXISTS idx_trades_status_created_at ON trades (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_wa_id_created_at ON messages (wa_id, created_at)',
+    ]),
+    (3, "index trades by status and id for keyset pagination", [
+        'CREATE INDEX IF NOT EXISTS idx_trades_status_id ON trades (status, id)',
+    ]),
+    (4, "record the submitter of each trade", [
+        'ALTER TABLE trades ADD COLUMN wa_id TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_trades_wa_id_id ON trades (wa_id, id)',
+    ]),
+    (5, "track processed webhook message ids", [
+        '''
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            message_id TEXT PRIMARY KEY,
+            processed_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_processed_messages_processed_at ON processed_messages (processed_at)',
+    ]),
+    (6, "store the WhatsApp message id for delivery receipts", [
+        'ALTER TABLE messages ADD COLUMN wa_message_id TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_messages_wa_message_id ON messages (wa_message_id)',
+    ]),
+    (7, "broadcast jobs and their per-recipient outcomes", [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            builder TEXT NOT NULL,
+            params TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts (id),
+            seq INTEGER NOT NULL,
+            recipient TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            wa_message_id TEXT,
+            error TEXT,
+            updated_at REAL,
+            PRIMARY KEY (broadcast_id, seq)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_broadcast_recipients_recipient ON broadcast_recipients (broadcast_id, recipient)',
+        'CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status_seq ON broadcast_recipients (broadcast_id, status, seq)',
+    ]),
+    (8, "durable outbound queue and dead letters", [
+        '''
+        CREATE TABLE IF NOT EXISTS outbound_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_outbound_queue_next_attempt_at ON outbound_queue (next_attempt_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            failed_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (9, "tell leased outbound messages apart from ones waiting to retry", [
+        'ALTER TABLE outbound_queue ADD COLUMN leased_until REAL',
+        'CREATE INDEX IF NOT EXISTS idx_outbound_queue_leased_until ON outbound_queue (leased_until)',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """
+    Apply every migration newer than the database's current version.
+
+    Each migration and its version bump commit together, so a failure leaves
+    the database at the last fully applied version.
+    """
+    current = get_schema_version(conn)
+    for version, description, statements in migrations:
+        if version <= current:
+            continue
+        with conn:
+            # DDL does not open an implicit transaction, so take the write lock
+            # explicitly, then re-check in case another process got here first.
+            conn.execute('BEGIN IMMEDIATE')
+            if get_schema_version(conn) >= version:
+                current = version
+                continue
+            logging.info(f"Applying database migration {version}: {description}")
+            for statement in statements:
+                conn.execute(statement)
+            # PRAGMA does not accept bound parameters; version is an int literal
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+        current = version
+    return current
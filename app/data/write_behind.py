@@ -0,0 +1,324 @@
+import atexit
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Delivery receipts only ever move a message forward through these states
+DELIVERY_STATUS_RANK = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+# Failures that say nothing about the records themselves (disk full, database
+# locked): the batch is kept and retried after a backoff. Anything else is
+# blamed on a record and the batch is split to find it.
+TRANSIENT_ERRORS = (OSError, sqlite3.OperationalError)
+
+# Longest wait between retries while storage keeps failing
+MAX_BACKOFF = 30.0
+
+
+class WriteBehindBuffer:
+    """
+    Base for buffers that collect records in memory and write them in batches.
+
+    A background thread writes the pending batch once `max_records` are
+    waiting or the oldest has waited `max_delay_ms`, whichever comes first.
+    `flush()` writes synchronously and runs at exit, so every accepted record
+    reaches storage on a clean shutdown. Subclasses define how records are
+    held (`_add`, `_take`, `_restore`, `_split`, `_drop_oldest`) and written
+    (`_write`).
+
+    A batch that fails with a transient error is kept and retried with
+    exponential backoff; one that fails otherwise is split in halves until the
+    bad records are isolated, and those are logged and dropped. At most
+    `max_pending` records are held; past that the oldest are dropped.
+    """
+
+    name = "write-behind"
+
+    def __init__(self, storage, max_records=100, max_delay_ms=200, max_pending=10_000):
+        self.storage = storage
+        self.max_records = max_records
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max_pending
+        self._pending = self._empty()
+        self._oldest = None
+        # Consecutive failed flushes, and when the flusher may try again
+        self._failures = 0
+        self._retry_at = None
+        self._dropped = 0
+        self._dropping = False
+        self._rejected = 0
+        self._cond = threading.Condition()
+        # Serializes writes so batches reach storage in the order accepted
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def configure(self, max_records, max_delay_ms):
+        """Change the batch size and delay, e.g. from the app config."""
+        with self._cond:
+            self.max_records = max_records
+            self.max_delay = max_delay_ms / 1000
+            self._cond.notify()
+
+    def _empty(self):
+        return []
+
+    def _add(self, record):
+        self._pending.append(record)
+
+    def _take(self):
+        batch, self._pending = self._pending, self._empty()
+        return batch
+
+    def _restore(self, batch):
+        # Put a failed batch back in front of anything accepted meanwhile
+        self._pending[:0] = batch
+
+    def _split(self, batch):
+        middle = len(batch) // 2
+        return batch[:middle], batch[middle:]
+
+    def _drop_oldest(self, count):
+        del self._pending[:count]
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def _write_through(self, record):
+        self._write(self._empty() + [record])
+
+    def _ensure_flusher(self):
+        # Caller holds self._cond. The thread does not survive a fork, so each
+        # process starts its own on first use.
+        pid = os.getpid()
+        if self._thread is None or self._pid != pid:
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _submit(self, record):
+        with self._cond:
+            if self._closed:
+                # Nothing will flush after close, so write through
+                self._write_through(record)
+                return
+            self._ensure_flusher()
+            self._add(record)
+            self._enforce_cap()
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            if len(self._pending) >= self.max_records:
+                self._cond.notify()
+
+    def _enforce_cap(self):
+        # Caller holds self._cond
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            if not self._dropping:
+                self._dropping = True
+                logging.error(f"{self.name} buffer is full; dropping the oldest records until storage recovers")
+            self._drop_oldest(excess)
+            self._dropped += excess
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._retry_at is not None and now < self._retry_at:
+                        self._cond.wait(self._retry_at - now)
+                        continue
+                    if len(self._pending) >= self.max_records:
+                        break
+                    if self._oldest is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._oldest + self.max_delay - now
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Already logged; the batch stays pending and is retried
+                pass
+
+    def flush(self):
+        """
+        Write every pending record to storage now. Returns the number written.
+
+        Raises if storage failed transiently; the unwritten records stay
+        pending and the flusher waits before trying again.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._take()
+                self._oldest = None
+            if not batch:
+                return 0
+            try:
+                written = self._write_isolating(batch)
+            except Exception:
+                with self._cond:
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + min(
+                        MAX_BACKOFF, max(self.max_delay, 0.1) * 2 ** (self._failures - 1)
+                    )
+                raise
+            with self._cond:
+                self._failures = 0
+                self._retry_at = None
+                self._dropping = False
+            return written
+
+    def _write_isolating(self, batch):
+        """
+        Write `batch`, splitting it to find and drop records storage rejects.
+
+        On a transient error everything not yet written is put back and the
+        error is raised.
+        """
+        try:
+            return self._write(batch)
+        except TRANSIENT_ERRORS as e:
+            logging.error(f"Error flushing {len(batch)} {self.name} records: {e}")
+            self._put_back(batch)
+            raise
+        except Exception as e:
+            if len(batch) == 1:
+                logging.error(f"Dropping {self.name} record {batch!r} that storage rejects: {e}")
+                with self._cond:
+                    self._rejected += 1
+                return 0
+            logging.warning(f"Storage rejected {len(batch)} {self.name} records ({e}); retrying them in halves")
+        first, second = self._split(batch)
+        try:
+            written = self._write_isolating(first)
+        except Exception:
+            self._put_back(second)
+            raise
+        return written + self._write_isolating(second)
+
+    def _put_back(self, batch):
+        with self._cond:
+            self._restore(batch)
+            self._enforce_cap()
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def metrics(self):
+        with self._cond:
+            return {"pending": len(self._pending), "dropped": self._dropped, "rejected": self._rejected}
+
+    def close(self):
+        """Stop the flusher thread and write out everything still pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+class MessageLogBuffer(WriteBehindBuffer):
+    """
+    Write-behind buffer for message logging.
+
+    `log()` only appends to an in-memory list; batches are written with
+    `storage.log_messages()`.
+    """
+
+    name = "message-log"
+
+    def log(self, wa_id, message_type, message_content, direction, wa_message_id=None):
+        """Queue a message log record; it is written on the next flush."""
+        self._submit((wa_id, message_type, message_content, direction, wa_message_id))
+
+    def _write(self, batch):
+        return self.storage.log_messages(batch)
+
+
+class DeliveryStatusBuffer(WriteBehindBuffer):
+    """
+    Coalesces delivery receipts per WhatsApp message id before writing them.
+
+    Every outbound message produces sent, delivered and read callbacks. Only
+    the furthest state per wamid is kept in memory, and batches are written
+    with `storage.update_message_statuses()`. The message log is flushed first
+    so that receipts for just-sent messages find their rows.
+    """
+
+    name = "delivery-status"
+
+    def __init__(self, storage, message_log=None, max_records=500, max_delay_ms=1000):
+        self.message_log = message_log
+        self._stats = {"received": 0, "coalesced": 0, "written": 0}
+        super().__init__(storage, max_records, max_delay_ms)
+
+    def _empty(self):
+        return {}
+
+    def _add(self, record):
+        wa_message_id, status = record
+        self._stats["received"] += 1
+        current = self._pending.get(wa_message_id)
+        if current is not None:
+            self._stats["coalesced"] += 1
+            if DELIVERY_STATUS_RANK.get(status, 0) <= DELIVERY_STATUS_RANK.get(current, 0):
+                return
+        self._pending[wa_message_id] = status
+
+    def _split(self, batch):
+        items = list(batch.items())
+        middle = len(items) // 2
+        return dict(items[:middle]), dict(items[middle:])
+
+    def _drop_oldest(self, count):
+        for wa_message_id in list(itertools.islice(self._pending, count)):
+            del self._pending[wa_message_id]
+
+    def _restore(self, batch):
+        for wa_message_id, status in batch.items():
+            current = self._pending.get(wa_message_id)
+            if current is None or DELIVERY_STATUS_RANK.get(status, 0) > DELIVERY_STATUS_RANK.get(current, 0):
+                self._pending[wa_message_id] = status
+
+    def _write_through(self, record):
+        wa_message_id, status = record
+        self._write({wa_message_id: status})
+
+    def _write(self, batch):
+        if self.message_log is not None:
+            try:
+                self.message_log.flush()
+            except Exception:
+                # Already logged and kept for retry; receipts need not wait for it
+                pass
+        written = self.storage.update_message_statuses(batch)
+        with self._cond:
+            self._stats["written"] += written
+        return written
+
+    def record(self, wa_message_id, status):
+        """Note the latest status for a message; it is written on the next flush."""
+        self._submit((wa_message_id, status))
+
+    def metrics(self):
+        metrics = super().metrics()
+        with self._cond:
+            return {**self._stats, **metrics}
@@ -1,38 +1,120 @@
-from functools import wraps
-from flask import current_app, jsonify, request
+from functools import lru_cache, wraps
+from flask import current_app, g, jsonify, request
 import logging
 import hashlib
 import hmac
+import json
+
+# Request bodies are hashed as they are read, in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=4)
+def _hmac_for_secret(app_secret):
+    """
+    Build the keyed HMAC once per App Secret.
+
+    Each request works on a `.copy()`, so the key is not re-derived per call.
+    """
+    return hmac.new(bytes(app_secret, "latin-1"), digestmod=hashlib.sha256)
 
 
 def validate_signature(payload, signature):
     """
     Validate the incoming payload's signature against our expected signature
     """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+
     # Use the App Secret to hash the payload
-    expected_signature = hmac.new(
-        bytes(current_app.config["APP_SECRET"], "latin-1"),
-        msg=payload.encode("utf-8"),
-        digestmod=hashlib.sha256,
-    ).hexdigest()
+    mac = _hmac_for_secret(current_app.config["APP_SECRET"]).copy()
+    mac.update(payload)
 
-    # Check if the signature matches
-    return hmac.compare_digest(expected_signature, signature)
+    # Check if the signature matches, in constant time
+    return hmac.compare_digest(mac.hexdigest().encode(), signature.encode("utf-8"))
+
+
+def _read_and_sign(max_bytes):
+    """
+    Read the raw request body in chunks, hashing each chunk as it arrives.
+
+    Returns (body, hexdigest), or (None, None) as soon as the body exceeds
+    `max_bytes`.
+    """
+    mac = _hmac_for_secret(current_app.config["APP_SECRET"]).copy()
+    body = bytearray()
+    stream = request.stream
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(body) + len(chunk) > max_bytes:
+            return None, None
+        mac.update(chunk)
+        body += chunk
+    return bytes(body), mac.hexdigest()
+
+
+async def read_and_sign_async(content, max_bytes, app_secret):
+    """
+    `_read_and_sign()` for an asyncio stream, e.g. aiohttp's `request.content`.
+
+    The event loop keeps serving other requests while the body arrives.
+    """
+    mac = _hmac_for_secret(app_secret).copy()
+    body = bytearray()
+    while True:
+        chunk = await content.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(body) + len(chunk) > max_bytes:
+            return None, None
+        mac.update(chunk)
+        body += chunk
+    return bytes(body), mac.hexdigest()
+
+
+def signature_matches(expected_signature, header):
+    """Compare our hex digest with an X-Hub-Signature-256 header, in constant time."""
+    signature = header[7:]  # Removing 'sha256='
+    return hmac.compare_digest(expected_signature.encode(), signature.encode("utf-8"))
+
+
+def get_verified_json():
+    """Return the JSON body parsed by `signature_required` for this request."""
+    return g.webhook_json
 
 
 def signature_required(f):
     """
     Decorator to ensure that the incoming requests to our webhook are valid and signed with the correct signature.
+
+    The body is verified over its raw bytes and then parsed once; the view
+    reads the result with `get_verified_json()`.
     """
 
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        signature = request.headers.get("X-Hub-Signature-256", "")[
-            7:
-        ]  # Removing 'sha256='
-        if not validate_signature(request.data.decode("utf-8"), signature):
+        max_bytes = current_app.config["WEBHOOK_MAX_BODY_BYTES"]
+        # Reject oversized bodies before reading them, when the size is declared
+        if request.content_length is not None and request.content_length > max_bytes:
+            logging.info("Webhook body too large")
+            return jsonify({"status": "error", "message": "Payload too large"}), 413
+
+        body, expected_signature = _read_and_sign(max_bytes)
+        if body is None:
+            logging.info("Webhook body too large")
+            return jsonify({"status": "error", "message": "Payload too large"}), 413
+
+        if not signature_matches(expected_signature, request.headers.get("X-Hub-Signature-256", "")):
             logging.info("Signature verification failed!")
             return jsonify({"status": "error", "message": "Invalid signature"}), 403
+
+        try:
+            g.webhook_json = json.loads(body)
+        except ValueError:
+            logging.error("Failed to decode JSON")
+            return jsonify({"status": "error", "message": "Invalid JSON provided"}), 400
         return f(*args, **kwargs)
 
     return decorated_function
@@ -1,19 +1,146 @@
-from openai import OpenAI
-import shelve
-from dotenv import load_dotenv
 import os
+import threading
 import time
 import logging
+import types
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
-client = OpenAI(api_key=OPENAI_API_KEY)
+from app.config import load_configurations
+from app.services.run_driver import AssistantRunError, RunDriver
+from app.services.thread_store import ThreadStore
+from app.utils.keyed_executor import KeyedExecutor
+
+# Settings copied from app.config by init_openai(). Nothing below touches the
+# network or disk at import; the client, run driver and thread store are
+# built on first use in each process, so they survive `gunicorn --preload`.
+_settings = None
+_state_lock = threading.Lock()
+_state = {"pid": None, "client": None, "run_driver": None, "thread_store": None}
+
+
+def init_openai(app):
+    """Bind the OpenAI service to the app's configuration."""
+    global _settings
+    with _state_lock:
+        _settings = dict(app.config)
+        # Rebuild the client and friends with the new settings on next use
+        _state["pid"] = None
+    reply_executor.workers = _settings["ASSISTANT_WORKERS"]
+    reply_executor.max_batch = _settings["ASSISTANT_MAX_BATCH"]
+
+
+def _setting(name):
+    global _settings
+    if _settings is None:
+        # Used outside create_app, e.g. from a script: read .env and the
+        # environment the same way the app does
+        holder = types.SimpleNamespace(config={})
+        load_configurations(holder)
+        _settings = holder.config
+    return _settings[name]
+
+
+def _get_state():
+    state = _state
+    if state["pid"] == os.getpid():
+        return state
+    with _state_lock:
+        if _state["pid"] != os.getpid():
+            # Imported here: the SDK alone takes a large share of startup time
+            from openai import OpenAI
+
+            # Point at a local OpenAI-compatible server for testing; None uses the default
+            client = OpenAI(api_key=_setting("OPENAI_API_KEY"), base_url=_setting("OPENAI_BASE_URL"))
+            _state["client"] = client
+            _state["run_driver"] = RunDriver(
+                client,
+                deadline=_setting("ASSISTANT_RUN_DEADLINE"),
+                streaming=_setting("ASSISTANT_RUN_STREAMING"),
+                poll_min_interval=_setting("ASSISTANT_POLL_MIN_INTERVAL"),
+                poll_max_interval=_setting("ASSISTANT_POLL_MAX_INTERVAL"),
+                on_request=lambda: _count("round_trips"),
+            )
+            # wa_id -> thread id, cached in memory and persisted in SQLite
+            _state["thread_store"] = ThreadStore(
+                _setting("THREADS_DB_PATH"), cache_size=_setting("THREADS_CACHE_SIZE")
+            )
+            _state["pid"] = os.getpid()
+    return _state
+
+
+def get_client():
+    """Return this process's OpenAI client, creating it on first use."""
+    return _get_state()["client"]
+
+
+def get_run_driver():
+    return _get_state()["run_driver"]
+
+
+def get_thread_store():
+    return _get_state()["thread_store"]
+
+
+_assistant_lock = threading.Lock()
+_assistant_cache = {"assistant": None, "expires_at": 0.0}
+
+# OpenAI API calls made while handling messages. round_trips / messages is
+# the per-message cost; every assistant_cache_hit is a retrieve that run would
+# have made before the assistant was cached, so it is a round trip saved.
+_metrics_lock = threading.Lock()
+_metrics = {"messages": 0, "runs": 0, "round_trips": 0, "assistant_retrieves": 0, "assistant_cache_hits": 0}
+
+
+def _count(*names, n=1):
+    with _metrics_lock:
+        for name in names:
+            _metrics[name] += n
+
+
+def get_openai_metrics():
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics["replies"] = reply_executor.metrics()
+    messages = metrics["messages"] or 1
+    metrics["round_trips_per_message"] = metrics["round_trips"] / messages
+    metrics["round_trips_saved_per_message"] = metrics["assistant_cache_hits"] / messages
+    # 1.0 without the cache (ASSISTANT_CACHE_TTL=0), as before it existed
+    metrics["assistant_retrieves_per_run"] = metrics["assistant_retrieves"] / (metrics["runs"] or 1)
+    return metrics
+
+
+def get_assistant():
+    """
+    Return the configured assistant, retrieving it at most once per TTL.
+    """
+    now = time.monotonic()
+    assistant = _assistant_cache["assistant"]
+    if assistant is not None and now < _assistant_cache["expires_at"]:
+        _count("assistant_cache_hits")
+        return assistant
+
+    with _assistant_lock:
+        # Another thread may have refreshed it while we waited
+        assistant = _assistant_cache["assistant"]
+        if assistant is not None and now < _assistant_cache["expires_at"]:
+            _count("assistant_cache_hits")
+            return assistant
+        assistant = get_client().beta.assistants.retrieve(_setting("OPENAI_ASSISTANT_ID"))
+        _count("round_trips", "assistant_retrieves")
+        _assistant_cache["assistant"] = assistant
+        _assistant_cache["expires_at"] = time.monotonic() + _setting("ASSISTANT_CACHE_TTL")
+        return assistant
+
+
+def invalidate_assistant():
+    """Drop the cached assistant, e.g. after editing it, so the next run refetches it."""
+    with _assistant_lock:
+        _assistant_cache["assistant"] = None
+        _assistant_cache["expires_at"] = 0.0
 
 
 def upload_file(path):
     # Upload a file with an "assistants" purpose
-    file = client.files.create(
+    file = get_client().files.create(
         file=open("../../data/airbnb-faq.pdf", "rb"), purpose="assistants"
     )
 
@@ -22,7 +149,7 @@ def create_assistant(file):
     """
     You currently cannot set the temperature for Assistant via the API.
     """
-    assistant = client.beta.assistants.create(
+    assistant = get_client().beta.assistants.create(
         name="WhatsApp AirBnb Assistant",
         instructions="You're a helpful WhatsApp assistant that can assist guests that are staying in our Paris AirBnb. Use your knowledge base to best respond to customer queries. If you don't know the answer, say simply that you cannot help with question and advice to contact the host directly. Be friendly and funny.",
         tools=[{"type": "retrieval"}],
@@ -32,66 +159,104 @@ def create_assistant(file):
     return assistant
 
 
-# Use context manager to ensure the shelf file is closed properly
 def check_if_thread_exists(wa_id):
-    with shelve.open("threads_db") as threads_shelf:
-        return threads_shelf.get(wa_id, None)
+    return get_thread_store().get(wa_id)
 
 
 def store_thread(wa_id, thread_id):
-    with shelve.open("threads_db", writeback=True) as threads_shelf:
-        threads_shelf[wa_id] = thread_id
-
+    """Store the thread for `wa_id`; returns the one stored first if another worker won."""
+    return get_thread_store().set(wa_id, thread_id)
 
-def run_assistant(thread, name):
-    # Retrieve the Assistant
-    assistant = client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
 
-    # Run the assistant
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id,
-        # instructions=f"You are having a conversation with {name}",
-    )
+def run_assistant(thread, name, new_messages=()):
+    # Retrieve the Assistant (cached)
+    assistant = get_assistant()
+    _count("runs")
 
-    # Wait for completion
-    # https://platform.openai.com/docs/assistants/how-it-works/runs-and-run-steps#:~:text=under%20failed_at.-,Polling%20for%20updates,-In%20order%20to
-    while run.status != "completed":
-        # Be nice to the API
-        time.sleep(0.5)
-        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+    # Run the assistant and wait for it, streaming or polling with backoff.
+    # New user messages ride along with the run instead of separate requests.
+    params = {}
+    if new_messages:
+        params["additional_messages"] = [
+            {"role": "user", "content": body} for body in new_messages
+        ]
+    try:
+        run, run_messages = get_run_driver().run(thread.id, assistant.id, **params)
+    except AssistantRunError as e:
+        logging.error(f"Assistant run failed for {name}: {e}")
+        raise
 
-    # Retrieve the Messages
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    new_message = messages.data[0].content[0].text.value
+    # Streaming already delivered the reply; otherwise fetch it
+    if run_messages:
+        new_message = run_messages[-1].content[0].text.value
+    else:
+        messages = get_client().beta.threads.messages.list(thread_id=thread.id)
+        _count("round_trips")
+        new_message = messages.data[0].content[0].text.value
     logging.info(f"Generated message: {new_message}")
     return new_message
 
 
-def generate_response(message_body, wa_id, name):
+def _reply_to_burst(wa_id, items):
+    """Answer every (message_body, name) queued for `wa_id` with one run."""
+    name = items[-1][1]
+    _count("messages", n=len(items))
+
     # Check if there is already a thread_id for the wa_id
     thread_id = check_if_thread_exists(wa_id)
 
     # If a thread doesn't exist, create one and store it
     if thread_id is None:
         logging.info(f"Creating new thread for {name} with wa_id {wa_id}")
-        thread = client.beta.threads.create()
-        store_thread(wa_id, thread.id)
-        thread_id = thread.id
+        thread = get_client().beta.threads.create()
+        _count("round_trips")
+        thread_id = store_thread(wa_id, thread.id)
+        if thread_id != thread.id:
+            # Another worker created one for this wa_id first; keep the
+            # conversation in a single thread
+            logging.info(f"Using thread {thread_id} stored concurrently for wa_id {wa_id}")
+            thread = get_client().beta.threads.retrieve(thread_id)
+            _count("round_trips")
 
     # Otherwise, retrieve the existing thread
     else:
         logging.info(f"Retrieving existing thread for {name} with wa_id {wa_id}")
-        thread = client.beta.threads.retrieve(thread_id)
+        thread = get_client().beta.threads.retrieve(thread_id)
+        _count("round_trips")
 
-    # Add message to thread
-    message = client.beta.threads.messages.create(
-        thread_id=thread_id,
-        role="user",
-        content=message_body,
-    )
+    if len(items) > 1:
+        logging.info(f"Answering {len(items)} messages from {wa_id} with one run")
 
-    # Run the assistant and get the new message
-    new_message = run_assistant(thread, name)
+    # Add the messages to the thread, run the assistant and get the new message
+    return run_assistant(thread, name, [message_body for message_body, _ in items])
 
-    return new_message
+
+# Runs for one wa_id never overlap (OpenAI rejects a second active run on a
+# thread), while different users are answered in parallel. Messages that
+# arrive while a user's run is in flight are answered together by the next.
+reply_executor = KeyedExecutor(
+    _reply_to_burst,
+    workers=8,
+    max_batch=10,
+    name="assistant-reply",
+)
+
+
+def submit_response(message_body, wa_id, name):
+    """
+    Queue a message for the assistant without waiting for the reply.
+
+    Returns a concurrent.futures.Future resolving to the reply, or to None
+    when the message was coalesced into a later message's run.
+    """
+    return reply_executor.submit(wa_id, (message_body, name))
+
+
+def generate_response(message_body, wa_id, name):
+    """
+    Return the assistant's reply to `message_body` from `wa_id`.
+
+    Returns None when a later message from the same user arrived first and
+    one reply covers both; only the caller holding that reply should send it.
+    """
+    return submit_response(message_body, wa_id, name).result()
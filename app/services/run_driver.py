@@ -0,0 +1,175 @@
+import logging
+import queue
+import threading
+import time
+
+# A run in any of these states will not change again without our help
+TERMINAL_STATUSES = frozenset(
+    {"completed", "failed", "expired", "cancelled", "incomplete", "requires_action"}
+)
+# Terminal states that leave the run holding the thread until it expires
+_CANCEL_ON = frozenset({"requires_action"})
+
+
+class AssistantRunError(Exception):
+    """An assistant run ended in a state other than `completed`."""
+
+    def __init__(self, run_id, status, last_error=None):
+        self.run_id = run_id
+        self.status = status
+        self.last_error = last_error
+        message = f"Run {run_id} ended with status {status}"
+        if last_error is not None:
+            message += f": {getattr(last_error, 'message', last_error)}"
+        super().__init__(message)
+
+
+class AssistantRunTimeout(AssistantRunError):
+    """An assistant run did not finish before the deadline and was cancelled."""
+
+    def __init__(self, run_id, status, deadline):
+        self.deadline = deadline
+        super().__init__(run_id, status, f"no result within {deadline}s")
+
+
+class RunDriver:
+    """
+    Starts an assistant run and waits for it to reach a terminal state.
+
+    With `streaming`, the run is created over server-sent events, so the
+    reply arrives as soon as it is produced, in a single request. Without it,
+    or with an SDK that has no `runs.stream`, the run is polled, starting at
+    `poll_min_interval` and backing off by `poll_factor` up to
+    `poll_max_interval`. Either way the wait is bounded by `deadline` seconds;
+    a run that overstays it, or that stops in `requires_action`, is cancelled
+    so it does not keep the thread locked.
+
+    `on_request` is called once per API request, for round-trip accounting.
+    """
+
+    def __init__(
+        self,
+        client,
+        deadline=60.0,
+        streaming=True,
+        poll_min_interval=0.1,
+        poll_max_interval=2.0,
+        poll_factor=1.5,
+        on_request=None,
+    ):
+        self.client = client
+        self.deadline = deadline
+        self.streaming = streaming
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self.poll_factor = poll_factor
+        self.on_request = on_request
+
+    def _request(self):
+        if self.on_request is not None:
+            self.on_request()
+
+    def run(self, thread_id, assistant_id, **params):
+        """
+        Run the assistant on `thread_id` and wait for it to finish.
+
+        Returns (run, messages): the completed run, and the messages it added
+        to the thread when streaming reported them (None otherwise). Raises
+        AssistantRunError for any other terminal state and
+        AssistantRunTimeout when the deadline passes.
+        """
+        deadline = time.monotonic() + self.deadline
+        if self.streaming and hasattr(self.client.beta.threads.runs, "stream"):
+            run, messages = self._stream(thread_id, assistant_id, deadline, params)
+        else:
+            run, messages = self._poll(thread_id, assistant_id, deadline, params), None
+
+        if run.status != "completed":
+            if run.status in _CANCEL_ON:
+                self._cancel(thread_id, run.id)
+            raise AssistantRunError(run.id, run.status, getattr(run, "last_error", None))
+        return run, messages
+
+    def _stream(self, thread_id, assistant_id, deadline, params):
+        # The SDK only checks its timeout per read, so a stream that stalls
+        # could outlast the deadline; it is read on a helper thread and
+        # abandoned once the deadline passes
+        self._request()
+        events = queue.Queue()
+        abandoned = threading.Event()
+        threading.Thread(
+            target=self._read_stream,
+            args=(events, abandoned, thread_id, assistant_id, deadline, params),
+            name="assistant-run-stream",
+            daemon=True,
+        ).start()
+
+        stream = None
+        messages = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                kind, item = events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if kind == "stream":
+                stream = item
+            elif kind == "event":
+                if item.event == "thread.message.completed":
+                    messages.append(item.data)
+            elif kind == "done":
+                return item, messages
+            else:
+                raise item
+
+        # Deadline passed mid-stream
+        abandoned.set()
+        run = stream.current_run if stream is not None else None
+        if run is None:
+            raise AssistantRunTimeout(None, None, self.deadline)
+        self._cancel(thread_id, run.id)
+        raise AssistantRunTimeout(run.id, run.status, self.deadline)
+
+    def _read_stream(self, events, abandoned, thread_id, assistant_id, deadline, params):
+        try:
+            with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                timeout=max(deadline - time.monotonic(), 0.001),
+                **params,
+            ) as stream:
+                events.put(("stream", stream))
+                for event in stream:
+                    if abandoned.is_set():
+                        return
+                    events.put(("event", event))
+                events.put(("done", stream.get_final_run()))
+        except Exception as e:
+            events.put(("error", e))
+
+    def _poll(self, thread_id, assistant_id, deadline, params):
+        runs = self.client.beta.threads.runs
+        run = runs.create(thread_id=thread_id, assistant_id=assistant_id, **params)
+        self._request()
+
+        interval = self.poll_min_interval
+        while run.status not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._cancel(thread_id, run.id)
+                raise AssistantRunTimeout(run.id, run.status, self.deadline)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * self.poll_factor, self.poll_max_interval)
+            run = runs.retrieve(thread_id=thread_id, run_id=run.id)
+            self._request()
+        return run
+
+    def _cancel(self, thread_id, run_id):
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            self._request()
+        except Exception as e:
+            # The run may have finished meanwhile; it expires on its own anyway
+            logging.warning(f"Could not cancel run {run_id}: {e}")
@@ -0,0 +1,109 @@
+import dbm
+import logging
+import os
+import shelve
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+CREATE_THREADS = '''
+    CREATE TABLE IF NOT EXISTS threads (
+        wa_id TEXT PRIMARY KEY,
+        thread_id TEXT NOT NULL
+    ) WITHOUT ROWID
+'''
+SELECT_THREAD = 'SELECT thread_id FROM threads WHERE wa_id = ?'
+INSERT_THREAD = '''
+    INSERT INTO threads (wa_id, thread_id) VALUES (?, ?)
+    ON CONFLICT (wa_id) DO NOTHING
+'''
+# user_version once the mappings of the old shelve store have been imported
+SHELF_IMPORTED = 1
+
+
+class ThreadStore:
+    """
+    wa_id -> OpenAI thread id mapping with an in-memory LRU in front of SQLite.
+
+    A cache hit never touches disk. The SQLite tier runs in WAL mode with a
+    busy timeout, so several gunicorn workers can share one file safely,
+    which shelve cannot do. The first open imports the mappings from the
+    `shelf_path` shelve file the app used before, if there is one.
+    """
+
+    def __init__(self, db_path="threads_db.sqlite", cache_size=1024, busy_timeout=5.0, shelf_path="threads_db"):
+        self.db_path = db_path
+        self.shelf_path = shelf_path
+        self.cache_size = cache_size
+        self.busy_timeout = busy_timeout
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+
+    def _get_connection(self):
+        # One connection per thread, reopened after a fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute(CREATE_THREADS)
+            self._import_shelf(conn)
+            self._local.conn = conn
+        return conn
+
+    def _import_shelf(self, conn):
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SHELF_IMPORTED:
+            return
+        with conn:
+            # Take the write lock, then re-check in case another worker got here first
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SHELF_IMPORTED:
+                return
+            if dbm.whichdb(self.shelf_path):
+                with shelve.open(self.shelf_path, flag="r") as shelf:
+                    mappings = list(shelf.items())
+                conn.executemany(INSERT_THREAD, mappings)
+                logging.info(f"Imported {len(mappings)} thread ids from {self.shelf_path}")
+            conn.execute(f'PRAGMA user_version = {SHELF_IMPORTED}')
+
+    def _remember(self, wa_id, thread_id):
+        with self._lock:
+            self._cache[wa_id] = thread_id
+            self._cache.move_to_end(wa_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, wa_id):
+        """Return the thread id for `wa_id`, or None if there is none yet."""
+        with self._lock:
+            thread_id = self._cache.get(wa_id)
+            if thread_id is not None:
+                self._cache.move_to_end(wa_id)
+                return thread_id
+
+        row = self._get_connection().execute(SELECT_THREAD, (wa_id,)).fetchone()
+        if row is None:
+            return None
+        self._remember(wa_id, row[0])
+        return row[0]
+
+    def set(self, wa_id, thread_id):
+        """
+        Store the thread id for `wa_id` unless it already has one.
+
+        Returns the stored thread id: when two workers create a thread for the
+        same new wa_id at once, the first one stored wins and both use it.
+        """
+        with self._get_connection() as conn:
+            conn.execute(INSERT_THREAD, (wa_id, thread_id))
+            stored = conn.execute(SELECT_THREAD, (wa_id,)).fetchone()[0]
+        self._remember(wa_id, stored)
+        return stored
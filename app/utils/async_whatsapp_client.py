@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+import aiohttp
+from flask import current_app
+
+
+class AsyncWhatsAppClient:
+    """
+    asyncio Graph API client with a shared aiohttp.ClientSession.
+
+    The client owns an event loop running on a background thread. Async code can
+    await `send()` / `send_many()` directly, while synchronous Flask views call
+    `submit()` / `submit_many()` and get a concurrent.futures.Future back, so no
+    request thread is held for the duration of an outbound call.
+    """
+
+    def __init__(self, app=None):
+        self.url = None
+        self.headers = None
+        self.timeout = 10
+        self.concurrency = 50
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._semaphore = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.url = f"https://graph.facebook.com/{config['VERSION']}/{config['PHONE_NUMBER_ID']}/messages"
+        self.headers = {
+            "Content-type": "application/json",
+            "Authorization": f"Bearer {config['ACCESS_TOKEN']}",
+        }
+        self.timeout = config["GRAPH_TIMEOUT"]
+        self.concurrency = config["GRAPH_ASYNC_CONCURRENCY"]
+        app.extensions["async_whatsapp_client"] = self
+        atexit.register(self.close)
+
+    def _ensure_loop(self):
+        # The loop thread does not survive a fork, so start one per process.
+        pid = os.getpid()
+        if self._loop is not None and self._pid == pid:
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != pid:
+                self._session = None
+                self._semaphore = None
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-whatsapp-client",
+                    daemon=True,
+                )
+                self._thread.start()
+                self._pid = pid
+        return self._loop
+
+    def attach(self, loop):
+        """
+        Run on an existing event loop, e.g. the async webhook server's, instead
+        of a thread of our own; `send()` is then awaited directly on that loop.
+        """
+        with self._lock:
+            self._session = None
+            self._semaphore = None
+            self._loop = loop
+            self._thread = None
+            self._pid = os.getpid()
+
+    async def aclose(self):
+        """Close the session from the loop it runs on."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        # Must be called on the client's loop; the session and semaphore are
+        # bound to the loop they were created on.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def send(self, data):
+        """
+        POST a serialized message payload and return (status, body).
+
+        Raises aiohttp.ClientError or asyncio.TimeoutError on failure.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.post(self.url, data=data) as response:
+                body = await response.text()
+                response.raise_for_status()
+                return response.status, body
+
+    async def send_many(self, payloads):
+        """
+        Send several payloads concurrently, bounded by the concurrency limit.
+
+        Returns one result per payload, in order; failures are returned as the
+        raised exception rather than aborting the whole batch.
+        """
+        return await asyncio.gather(
+            *(self.send(data) for data in payloads), return_exceptions=True
+        )
+
+    def submit(self, data):
+        """Schedule `send()` from synchronous code and return a Future."""
+        return asyncio.run_coroutine_threadsafe(self.send(data), self._ensure_loop())
+
+    def submit_many(self, payloads):
+        """Schedule `send_many()` from synchronous code and return a Future."""
+        return asyncio.run_coroutine_threadsafe(
+            self.send_many(payloads), self._ensure_loop()
+        )
+
+    def close(self, timeout=5):
+        if self._loop is None or self._pid != os.getpid():
+            return
+        if self._thread is None:
+            # Attached to a loop we do not own; its owner awaits aclose()
+            self._loop = None
+            self._session = None
+            return
+        if self._session is not None:
+            future = asyncio.run_coroutine_threadsafe(self._session.close(), self._loop)
+            try:
+                future.result(timeout)
+            except Exception as e:
+                logging.error(f"Error closing aiohttp session: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        self._session = None
+
+
+def get_async_whatsapp_client():
+    return current_app.extensions["async_whatsapp_client"]
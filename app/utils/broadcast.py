@@ -0,0 +1,204 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from app.data import storage
+from app.utils.messages import (
+    get_greetings_message_input,
+    get_menu_message_input,
+    get_raise_trade_message_input,
+    get_text_message_input,
+)
+from app.utils.outbound_scheduler import OutboundQueueFull, OutboundScheduler, PRIORITY_BULK
+from app.utils.whatsapp_utils import log_outbound_message
+
+
+def _raise_trade_message_input(recipient):
+    # Each recipient gets a form link carrying their own wa_id
+    return get_raise_trade_message_input(recipient, recipient)
+
+
+# Message builders a broadcast may use: name -> builder(recipient, **params)
+BROADCAST_BUILDERS = {
+    "text": get_text_message_input,
+    "menu": get_menu_message_input,
+    "greetings": get_greetings_message_input,
+    "raise_trade": _raise_trade_message_input,
+}
+
+
+class BroadcastManager:
+    """
+    Creates broadcast jobs and sends them through the outbound scheduler.
+
+    A job is a builder name from BROADCAST_BUILDERS, its parameters and a
+    recipient list, all recorded in storage. Sending claims recipients in
+    batches (pending -> sending, persisted before any send) and records each
+    outcome (sent/failed). Messages go out as bulk priority under the
+    scheduler's rate limits, with the next batch submitted while the previous
+    one is still in flight.
+
+    Resuming after a crash marks recipients still in "sending" as "unknown"
+    rather than sending to them again, so nobody gets a message twice.
+    """
+
+    def __init__(self, app=None, batch_size=200):
+        self.batch_size = batch_size
+        self.scheduler = None
+        self._own_scheduler = False
+        self._threads = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.batch_size = app.config["BROADCAST_BATCH_SIZE"]
+        # Share the app's scheduler, if enabled, so broadcasts and replies
+        # draw from the same buckets and replies keep their priority
+        self.scheduler = app.extensions.get("outbound_scheduler")
+        if self.scheduler is None:
+            # Otherwise broadcasts get one of their own, kept out of
+            # app.extensions so replies and the durable queue still send directly
+            self.scheduler = OutboundScheduler()
+            self.scheduler.configure(app)
+            self._own_scheduler = True
+            atexit.register(self.shutdown)
+        app.extensions["broadcasts"] = self
+
+    def create(self, builder, recipients, params=None):
+        """
+        Record a new broadcast job and return its id; nothing is sent yet.
+
+        Raises ValueError for an unknown builder or parameters it does not take.
+        """
+        params = params or {}
+        if builder not in BROADCAST_BUILDERS:
+            raise ValueError(f"Unknown broadcast builder: {builder}")
+        recipients = [recipient for recipient in recipients if recipient]
+        if not recipients:
+            raise ValueError("A broadcast needs at least one recipient")
+        try:
+            BROADCAST_BUILDERS[builder](recipients[0], **params)
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for {builder}: {e}")
+        broadcast_id = storage.create_broadcast(builder, params, recipients)
+        logging.info(f"Created broadcast {broadcast_id} ({builder}) to {len(recipients)} recipients")
+        return broadcast_id
+
+    def run(self, broadcast_id):
+        """Send a broadcast to every pending recipient and return its summary."""
+        broadcast = storage.get_broadcast(broadcast_id)
+        if broadcast is None:
+            raise ValueError(f"Unknown broadcast: {broadcast_id}")
+        if broadcast["status"] in ("completed", "cancelled"):
+            return broadcast
+        build = BROADCAST_BUILDERS[broadcast["builder"]]
+        params = broadcast["params"]
+
+        storage.update_broadcast_status(broadcast_id, "running")
+        in_flight = deque()
+        claimed = True
+        while claimed or in_flight:
+            claimed = []
+            if storage.get_broadcast(broadcast_id)["status"] == "running":
+                claimed = storage.claim_broadcast_recipients(broadcast_id, self.batch_size)
+            if claimed:
+                in_flight.append(self._submit(build, params, claimed))
+            # Keep one batch in flight behind the one being collected
+            if in_flight and (len(in_flight) > 1 or not claimed):
+                self._collect(broadcast_id, in_flight.popleft())
+
+        broadcast = storage.get_broadcast(broadcast_id)
+        if broadcast["status"] == "running":
+            storage.update_broadcast_status(broadcast_id, "completed")
+            broadcast["status"] = "completed"
+        logging.info(f"Broadcast {broadcast_id} {broadcast['status']}: {broadcast['counts']}")
+        return broadcast
+
+    def _submit(self, build, params, recipients):
+        batch = []
+        for recipient in recipients:
+            data = build(recipient, **params)
+            batch.append((recipient, data, self.scheduler.submit(data, recipient, PRIORITY_BULK)))
+        return batch
+
+    def _collect(self, broadcast_id, batch):
+        results = []
+        requeued = 0
+        for recipient, data, future in batch:
+            try:
+                response = future.result()
+            except OutboundQueueFull:
+                # Never sent, so it is safe to hand out again
+                results.append((recipient, "pending", None, None))
+                requeued += 1
+                continue
+            except Exception as e:
+                results.append((recipient, "failed", None, str(e)))
+                continue
+            if response.ok:
+                wa_message_id = (json.loads(response.text).get("messages") or [{}])[0].get("id")
+                results.append((recipient, "sent", wa_message_id, None))
+                log_outbound_message(data, response.text)
+            else:
+                results.append((recipient, "failed", None, f"HTTP {response.status_code}: {response.text[:500]}"))
+        storage.record_broadcast_results(broadcast_id, results)
+        if requeued:
+            logging.warning(f"Broadcast {broadcast_id}: outbound queue full, {requeued} recipients requeued")
+            time.sleep(1)
+        broadcast = storage.get_broadcast(broadcast_id)
+        logging.info(
+            f"Broadcast {broadcast_id}: {broadcast['counts'].get('sent', 0)} sent, "
+            f"{broadcast['counts'].get('failed', 0)} failed, "
+            f"{broadcast['counts'].get('pending', 0)} pending of {broadcast['total']}"
+        )
+
+    def start(self, broadcast_id):
+        """Run a broadcast on a background thread; returns the thread."""
+        with self._lock:
+            thread = self._threads.get(broadcast_id)
+            if thread is not None and thread.is_alive():
+                return thread
+            thread = threading.Thread(
+                target=self._run_logged, args=(broadcast_id,), name=f"broadcast-{broadcast_id}", daemon=True
+            )
+            self._threads[broadcast_id] = thread
+            thread.start()
+            return thread
+
+    def _run_logged(self, broadcast_id):
+        try:
+            self.run(broadcast_id)
+        except Exception as e:
+            logging.error(f"Broadcast {broadcast_id} stopped: {e}")
+
+    def resume(self, broadcast_id):
+        """
+        Continue a broadcast that stopped part-way, e.g. in a crash.
+
+        Recipients caught mid-send become "unknown" and are not retried.
+        """
+        interrupted = storage.mark_broadcast_interrupted(broadcast_id)
+        if interrupted:
+            logging.warning(f"Broadcast {broadcast_id}: {interrupted} recipients in an unknown state, not resending")
+        if storage.get_broadcast(broadcast_id)["status"] != "cancelled":
+            storage.update_broadcast_status(broadcast_id, "running")
+        return self.run(broadcast_id)
+
+    def cancel(self, broadcast_id):
+        """Stop claiming recipients; messages already submitted still go out."""
+        return storage.update_broadcast_status(broadcast_id, "cancelled")
+
+    def shutdown(self, timeout=5):
+        """Stop the broadcasts' own scheduler, if they have one; the app's is stopped separately."""
+        if self._own_scheduler:
+            self.scheduler.shutdown(timeout)
+
+
+def get_broadcast_manager():
+    return current_app.extensions["broadcasts"]
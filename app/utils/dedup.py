@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class DedupCache:
+    """
+    Bounded TTL+LRU set of webhook message ids that were already handled.
+
+    Meta redelivers a webhook when the acknowledgment is slow, so the same
+    `messages[].id` can arrive more than once. The in-memory tier answers
+    repeats within this process. The optional persistent tier, the storage
+    backend's `mark_message_processed()`, also catches repeats that arrive
+    after a restart. With SQLite it is shared by every worker process; the
+    JSON backend keeps a separate in-memory copy per process, so it only
+    survives restarts.
+    """
+
+    # Expired rows are pruned from the persistent tier every this many inserts
+    PRUNE_EVERY = 1000
+
+    def __init__(self, app=None, max_size=10000, ttl=86400, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "persistent_hits": 0}
+        self._inserts = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config["DEDUP_CACHE_SIZE"]
+        self.ttl = app.config["DEDUP_TTL_SECONDS"]
+        app.extensions["dedup_cache"] = self
+
+    def seen(self, message_id):
+        """
+        Record `message_id` and report whether it was already handled.
+
+        Returns True for a duplicate, which the caller should skip.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(message_id)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(message_id)
+                self._stats["hits"] += 1
+                return True
+            self._remember(message_id, now)
+
+        if self.store is not None and not self.store.mark_message_processed(message_id):
+            with self._lock:
+                self._stats["hits"] += 1
+                self._stats["persistent_hits"] += 1
+            return True
+
+        with self._lock:
+            self._stats["misses"] += 1
+            self._inserts += 1
+            prune = self.store is not None and self._inserts % self.PRUNE_EVERY == 0
+        if prune:
+            self.store.prune_processed_messages(self.ttl)
+        return False
+
+    def _remember(self, message_id, now):
+        # Caller holds the lock
+        self._entries[message_id] = now + self.ttl
+        self._entries.move_to_end(message_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries), "capacity": self.max_size}
+
+
+def get_dedup_cache():
+    return current_app.extensions["dedup_cache"]
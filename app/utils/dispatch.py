@@ -0,0 +1,116 @@
+import atexit
+import logging
+import queue
+import threading
+
+from flask import current_app
+
+
+class WebhookDispatcher:
+    """
+    Bounded in-process queue served by a pool of worker threads.
+
+    The webhook view puts verified events on the queue and returns 200 straight
+    away, so Meta gets its acknowledgment before any Graph API round-trip. Each
+    job runs inside an app context so handlers can keep using `current_app`.
+    """
+
+    _STOP = object()
+
+    def __init__(self, app=None, handler=None, max_size=1000, workers=4):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.app = None
+        self._queue = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"enqueued": 0, "processed": 0, "failed": 0, "dropped": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["webhook_dispatcher"] = self
+        atexit.register(self.shutdown)
+
+    def _start_workers(self):
+        # Threads are started on first use rather than in create_app, so a
+        # pre-forking server does not lose them in its worker processes.
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"webhook-dispatch-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload):
+        """
+        Queue a payload for background handling.
+
+        Returns False if the dispatcher is shut down or the queue is full; the
+        caller should then answer with a non-2xx status so Meta redelivers.
+        """
+        with self._lock:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+            if not self._threads:
+                self._start_workers()
+            try:
+                self._queue.put_nowait(payload)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                logging.warning("Webhook dispatch queue full, dropping event")
+                return False
+            self._stats["enqueued"] += 1
+            return True
+
+    def _worker(self):
+        while True:
+            payload = self._queue.get()
+            try:
+                if payload is self._STOP:
+                    return
+                with self.app.app_context():
+                    self.handler(payload)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                logging.error(f"Error processing queued webhook event: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def metrics(self):
+        """Return queue depth and counters for the dispatcher."""
+        with self._lock:
+            return {
+                **self._stats,
+                "depth": self._queue.qsize(),
+                "capacity": self.max_size,
+                "workers": len(self._threads),
+            }
+
+    def shutdown(self, timeout=None):
+        """Stop accepting events and drain whatever is already queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            # Sentinels queue behind pending events, so everything already
+            # accepted is processed before the workers exit.
+            self._queue.put(self._STOP)
+        for thread in threads:
+            thread.join(timeout)
+        logging.info("Webhook dispatcher drained")
+
+
+def get_dispatcher():
+    return current_app.extensions["webhook_dispatcher"]
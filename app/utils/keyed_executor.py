@@ -0,0 +1,110 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class KeyedExecutor:
+    """
+    Thread pool that runs work for the same key one batch at a time.
+
+    `submit(key, item)` queues an item behind any work already pending or
+    running for `key`; different keys run in parallel on up to `workers`
+    threads. When a key's turn comes, everything queued for it so far (up to
+    `max_batch` items) is handed to `handler(key, items)` in one call, so a
+    burst is handled as a single unit of work.
+
+    Each submit returns a Future. The handler's result is set on the future
+    of the last item in the batch; the others resolve to None, meaning they
+    were answered together with a later item. If the handler raises, every
+    future in the batch gets the exception.
+    """
+
+    def __init__(self, handler, workers=8, max_batch=20, name="keyed"):
+        self.handler = handler
+        self.workers = workers
+        self.max_batch = max_batch
+        self.name = name
+        self._pending = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._stats = {"submitted": 0, "batches": 0, "coalesced": 0, "failed": 0}
+        atexit.register(self.shutdown)
+
+    def _get_pool(self):
+        # Caller holds the lock. Pool threads do not survive a fork, so each
+        # process starts its own on first use.
+        if self._pool is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = {}
+            self._active = set()
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=self.name
+            )
+        return self._pool
+
+    def submit(self, key, item):
+        """Queue `item` for `key`. Returns a Future for the batch result."""
+        future = Future()
+        with self._lock:
+            pool = self._get_pool()
+            self._pending.setdefault(key, deque()).append((item, future))
+            self._stats["submitted"] += 1
+            if key not in self._active:
+                self._active.add(key)
+                pool.submit(self._drain, key)
+        return future
+
+    def _take(self, key):
+        # Caller holds the lock
+        queued = self._pending.get(key)
+        if not queued:
+            self._pending.pop(key, None)
+            self._active.discard(key)
+            return None
+        batch = [queued.popleft() for _ in range(min(len(queued), self.max_batch))]
+        self._stats["batches"] += 1
+        self._stats["coalesced"] += len(batch) - 1
+        return batch
+
+    def _drain(self, key):
+        # Runs batches for one key until nothing is left; only one _drain per
+        # key is ever scheduled, which is what serializes the key.
+        while True:
+            with self._lock:
+                batch = self._take(key)
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            try:
+                result = self.handler(key, items)
+            except Exception as e:
+                logging.error(f"Error handling {len(items)} {self.name} item(s) for {key}: {e}")
+                with self._lock:
+                    self._stats["failed"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for _, future in batch[:-1]:
+                future.set_result(None)
+            batch[-1][1].set_result(result)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "active_keys": len(self._active),
+                "pending": sum(len(queued) for queued in self._pending.values()),
+                "workers": self.workers,
+            }
+
+    def shutdown(self, wait=True):
+        """Finish queued work and stop the pool."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=wait)
@@ -1,157 +1,253 @@
 import json
+import re
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from urllib.parse import urlencode
 from app.data import storage
 
-def get_text_message_input(recipient, text):
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "text",
-            "text": {"preview_url": False, "body": text},
-        }
-    )
+# WhatsApp list messages allow at most 10 rows; one is kept for "Next page"
+TRADE_HISTORY_PAGE_SIZE = 9
 
-def get_menu_message_input(recipient):
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "interactive",
-            "interactive": {
-                "type": "list",
-                "header": {
-                    "type": "text",
-                    "text": "Choose an option"
-                },
-                "body": {
-                    "text": "Choose from the following options"
-                },
-                "footer": {
-                    "text": "Choose from the following options"
-                },
-                "action": {
-                    "button": "Select",
-                    "sections": [
+# Number of recipients whose static interactive payloads are kept serialized
+STATIC_MESSAGE_CACHE_SIZE = 1024
+
+# Payloads are serialized once at import with numbered placeholders where the
+# variable fields go. Rendering then only JSON-escapes those fields and joins
+# the prebuilt pieces, which gives exactly the same string as json.dumps of
+# the full payload.
+_FIELD_PATTERN = re.compile(r'"\\u0000(\d+)\\u0000"')
+
+
+def _field(index):
+    return f"\x00{index}\x00"
+
+
+def _compile_template(payload):
+    """Serialize `payload` and split it around its placeholder fields."""
+    pieces = _FIELD_PATTERN.split(json.dumps(payload))
+    # re.split alternates literal text with the captured field numbers
+    return tuple(pieces[0::2]), tuple(int(index) for index in pieces[1::2])
+
+
+def _encode(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def _render(template, *values):
+    parts, fields = template
+    out = [parts[0]]
+    for index, part in zip(fields, parts[1:]):
+        out.append(_encode(values[index]))
+        out.append(part)
+    return "".join(out)
+
+
+_TEXT_TEMPLATE = _compile_template(
+    {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": _field(0),
+        "type": "text",
+        "text": {"preview_url": False, "body": _field(1)},
+    }
+)
+
+_MENU_TEMPLATE = _compile_template(
+    {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": _field(0),
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {
+                "type": "text",
+                "text": "Choose an option"
+            },
+            "body": {
+                "text": "Choose from the following options"
+            },
+            "footer": {
+                "text": "Choose from the following options"
+            },
+            "action": {
+                "button": "Select",
+                "sections": [
+                    {
+                        "title": "Select an option",
+                        "rows": [
+                        {
+                            "id": "1",
+                            "title": "Option 1",
+                            "description": "Option 1 description"
+                        },
                         {
-                            "title": "Select an option",
-                            "rows": [
+                            "id": "2",
+                            "title": "Option 2",
+                            "description": "Option 2 description"
+                        }
+                        ]
+                    }
+                ]
+            }
+        }
+    }
+)
+
+_GREETINGS_TEMPLATE = _compile_template(
+    {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": _field(0),
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {
+                "type": "text",
+                "text": "Greetings from Traders"
+            },
+            "body": {
+                "text": "What would you like to do?"
+            },
+            "footer": {
+                "text": "Choose from the following options"
+            },
+            "action": {
+                "button": "Select any one",
+                "sections": [
+                    {
+                        "title": "Section 1",
+                        "rows": [
                             {
-                                "id": "1",
-                                "title": "Option 1",
-                                "description": "Option 1 description"
+                                "id": "initiateTrade",
+                                "title": "Initiate a new trade",
                             },
                             {
-                                "id": "2",
-                                "title": "Option 2",
-                                "description": "Option 2 description"
+                                "id": "viewTradeHistory",
+                                "title": "View my trade history",
                             }
-                            ]
-                        }
-                    ]
-                }
+                        ]
+                    }
+                ]
             }
         }
-    )
+    }
+)
 
-def get_greetings_message_input(recipient):
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "interactive",
-            "interactive": {
-                "type": "list",
-                "header": {
-                    "type": "text",
-                    "text": "Greetings from Traders"
-                },
-                "body": {
-                    "text": "What would you like to do?"
-                },
-                "footer": {
-                    "text": "Choose from the following options"
-                },
-                "action": {
-                    "button": "Select any one",
-                    "sections": [
-                        {
-                            "title": "Section 1",
-                            "rows": [
-                                {
-                                    "id": "initiateTrade",
-                                    "title": "Initiate a new trade",
-                                },
-                                {
-                                    "id": "viewTradeHistory",
-                                    "title": "View my trade history",
-                                }
-                            ]
-                        }
-                    ]
-                }
+_RAISE_TRADE_TEMPLATE = _compile_template(
+    {
+        "recipient_type": "individual",
+        "messaging_product": "whatsapp",
+        "to": _field(0),
+        "type": "text",
+        "text": {
+            "preview_url": True,
+            "body": _field(1)
+        }
+    }
+)
+
+_APPROVE_TRADE_TEMPLATE = _compile_template(
+    {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": _field(0),
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {
+                "type": "text",
+                "text": "Approve a trade"
+            },
+            "body": {
+                "text": _field(1)
+            },
+            "footer": {
+                "text": "Choose from the following options"
+            },
+            "action": {
+                "button": "Select any one",
+                "sections": [
+                    {
+                        "title": "Section 1",
+                        "rows": [
+                            {
+                                "id": _field(2),
+                                "title": "Approve the trade",
+                            },
+                            {
+                                "id": _field(3),
+                                "title": "Reject the trade",
+                            }
+                        ]
+                    }
+                ]
             }
         }
-    )
+    }
+)
 
-def get_raise_trade_message_input(recipient):
-    return json.dumps(
-        {
-            "recipient_type": "individual",
-            "messaging_product": "whatsapp",
-            "to": recipient,
-            "type": "text",
-            "text": {
-                "preview_url": True,
-                "body": "Click here to raise a trade: https://owl-tolerant-accurately.ngrok-free.app/"
+_TRADE_HISTORY_TEMPLATE = _compile_template(
+    {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": _field(0),
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {
+                "type": "text",
+                "text": "Deal ID"
+            },
+            "body": {
+                "text": "Select a deal ID to view the details"
+            },
+            "footer": {
+                "text": "Choose from the following options"
+            },
+            "action": {
+                "button": "Select any one",
+                "sections": [
+                    {
+                        "title": "Section 1",
+                        "rows": _field(1)
+                    }
+                ]
             }
         }
-    )
+    }
+)
+
+def get_text_message_input(recipient, text):
+    return _render(_TEXT_TEMPLATE, recipient, text)
+
+@lru_cache(maxsize=STATIC_MESSAGE_CACHE_SIZE)
+def get_menu_message_input(recipient):
+    return _render(_MENU_TEMPLATE, recipient)
+
+@lru_cache(maxsize=STATIC_MESSAGE_CACHE_SIZE)
+def get_greetings_message_input(recipient):
+    return _render(_GREETINGS_TEMPLATE, recipient)
+
+def get_raise_trade_message_input(recipient, wa_id=None):
+    # The submitter's wa_id rides along in the form link so the trade records its owner
+    url = "https://owl-tolerant-accurately.ngrok-free.app/"
+    if wa_id:
+        url += "?" + urlencode({"wa_id": wa_id})
+    return _render(_RAISE_TRADE_TEMPLATE, recipient, "Click here to raise a trade: " + url)
 
 def get_trade_details_text_message_input(trade_id, person_name, product_name, quantity, price):
     return "Name - " + person_name + " \n" + "Product - " + product_name + " \n" + "Quantity - " + str(quantity) + " \n" + "Price - " + str(price) + " \n" + "Trade ID - " + str(trade_id)
 
 def get_approve_trade_message_input(recipient, trade_id, person_name, product_name, quantity, price):
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "interactive",
-            "interactive": {
-                "type": "list",
-                "header": {
-                    "type": "text",
-                    "text": "Approve a trade"
-                },
-                "body": {
-                    "text": get_trade_details_text_message_input(trade_id, person_name, product_name, quantity, price)
-                },
-                "footer": {
-                    "text": "Choose from the following options"
-                },
-                "action": {
-                    "button": "Select any one",
-                    "sections": [
-                        {
-                            "title": "Section 1",
-                            "rows": [
-                                {
-                                    "id": "approveTrade_" + str(trade_id),
-                                    "title": "Approve the trade",
-                                },
-                                {
-                                    "id": "rejectTrade_" + str(trade_id),
-                                    "title": "Reject the trade",
-                                }
-                            ]
-                        }
-                    ]
-                }
-            }
-        }
+    return _render(
+        _APPROVE_TRADE_TEMPLATE,
+        recipient,
+        get_trade_details_text_message_input(trade_id, person_name, product_name, quantity, price),
+        "approveTrade_" + str(trade_id),
+        "rejectTrade_" + str(trade_id),
     )
 
 def get_trade_id_list_message_input(recipient):
@@ -159,7 +255,7 @@ def get_trade_id_list_message_input(recipient):
     
     return json.dumps({
         "messaging_product": "whatsapp",
-        "recipient_type": "individual", 
+        "recipient_type": "individual",
         "to": recipient,
         "type": "interactive",
         "interactive": {
@@ -186,44 +282,24 @@ def get_trade_id_list_message_input(recipient):
         }
     })
 
-def get_view_trade_history_message_input(recipient):
-    trades = storage.get_all_trades()
+def get_view_trade_history_message_input(recipient, cursor=None, wa_id=None):
+    # Only the requester's own trades, unless no requester is known
+    if wa_id:
+        trades, next_cursor = storage.get_trades_for(wa_id, limit=TRADE_HISTORY_PAGE_SIZE, cursor=cursor)
+    else:
+        trades, next_cursor = storage.get_trades_page(limit=TRADE_HISTORY_PAGE_SIZE, cursor=cursor)
     rows = []
     for trade in trades:
         rows.append({
             "id": f"viewTrade_{trade['id']}",
             "title": f"Trade ID: {trade['id']} - {trade['product_name']}"
         })
-    return json.dumps(
-        {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": recipient,
-            "type": "interactive",
-            "interactive": {
-                "type": "list",
-                "header": {
-                    "type": "text",
-                    "text": "Deal ID"
-                },
-                "body": {
-                    "text": "Select a deal ID to view the details"
-                },
-                "footer": {
-                    "text": "Choose from the following options"
-                },
-                "action": {
-                    "button": "Select any one",
-                    "sections": [
-                        {
-                            "title": "Section 1",
-                            "rows": rows
-                        }
-                    ]
-                }
-            }
-        }
-    )
+    if next_cursor is not None:
+        rows.append({
+            "id": f"viewTradeHistory_{next_cursor}",
+            "title": "Next page"
+        })
+    return _render(_TRADE_HISTORY_TEMPLATE, recipient, rows)
 
 def get_trade_details_message_input(recipient, trade_id):
     trade = storage.get_trade(trade_id)
@@ -231,5 +307,3 @@ def get_trade_details_message_input(recipient, trade_id):
         return get_text_message_input(recipient, get_trade_details_text_message_input(trade_id, trade["person_name"], trade["product_name"], trade["quantity"], trade["price"]))
     else:
         return get_text_message_input(recipient, "Trade not found")
-
-
@@ -0,0 +1,283 @@
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from flask import current_app
+
+from app.data import storage, DatabaseManager
+from app.utils.outbound_scheduler import OutboundQueueFull, PRIORITY_INTERACTIVE
+
+
+class DurableOutboundQueue:
+    """
+    Outbound messages persisted in SQLite and sent by background workers.
+
+    `enqueue()` commits the payload before returning, so a reply survives
+    Graph API timeouts, network errors and restarts. A sender thread per
+    process leases due messages and sends them (through the outbound
+    scheduler when it is enabled), claiming more as sends finish. Only one
+    message per recipient is leased at a time, by any process, so a
+    recipient's messages go out one after another, in queue order, while
+    different recipients proceed independently. Leases are renewed for as
+    long as a send is in progress. A message waiting for a retry does not
+    hold up later ones.
+
+    Timeouts, connection errors, 429s and 5xx responses are retried with
+    exponential backoff and jitter. After `max_attempts`, or on any other 4xx
+    (which a retry would not fix), the message moves to the dead letters,
+    where `flask outbound` can list and replay it.
+
+    The queue lives in the SQLite storage database when STORAGE_BACKEND is
+    "sqlite" and in its own file (DURABLE_QUEUE_DB_PATH) otherwise.
+    """
+
+    def __init__(self, app=None, sender=None):
+        self.sender = sender
+        self.app = None
+        self.db_path = "app/data/outbound_queue.db"
+        self.use_storage = False
+        self.workers = 4
+        self.batch_size = 50
+        self.max_attempts = 8
+        self.backoff = 2.0
+        self.max_backoff = 600.0
+        self.lease = 120.0
+        self.poll_interval = 1.0
+        self._db = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = None
+        self._pid = None
+        self._closed = False
+        # Messages leased by this process and not yet finished, by id
+        self._in_flight = {}
+        self._stats = {"enqueued": 0, "sent": 0, "retried": 0, "dead_lettered": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.app = app
+        self.db_path = config["DURABLE_QUEUE_DB_PATH"]
+        self.use_storage = config["STORAGE_BACKEND"] == "sqlite"
+        self.workers = config["DURABLE_QUEUE_WORKERS"]
+        self.batch_size = config["DURABLE_QUEUE_BATCH_SIZE"]
+        self.max_attempts = config["DURABLE_QUEUE_MAX_ATTEMPTS"]
+        self.backoff = config["DURABLE_QUEUE_BACKOFF"]
+        self.max_backoff = config["DURABLE_QUEUE_MAX_BACKOFF"]
+        self.lease = config["DURABLE_QUEUE_LEASE"]
+        app.extensions["outbound_queue"] = self
+        # Picks up messages left queued by a previous run once the process
+        # serves its first request
+        app.before_request(self.start)
+        atexit.register(self.shutdown)
+
+    @property
+    def db(self):
+        """The DatabaseManager holding the queue, opened on first use."""
+        if self.use_storage:
+            return storage.get()
+        if self._db is None:
+            with self._cond:
+                if self._db is None:
+                    # DatabaseManager reconnects after a fork by itself
+                    self._db = DatabaseManager(self.db_path)
+        return self._db
+
+    def _ensure_started(self):
+        # Caller holds self._cond. Threads do not survive a fork; the child
+        # starts its own sender, and the leases keep the two apart.
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        self._pid = pid
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbound-queue-send")
+        self._thread = threading.Thread(target=self._run, name="outbound-queue", daemon=True)
+        self._thread.start()
+
+    def start(self):
+        """Start sending whatever is already queued, e.g. after a restart."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if not self._closed:
+                self._ensure_started()
+
+    def enqueue(self, data, priority=PRIORITY_INTERACTIVE):
+        """Persist a serialized message payload for sending. Returns its queue id."""
+        recipient = json.loads(data)["to"]
+        message_id = self.db.enqueue_outbound(recipient, data, priority)
+        with self._cond:
+            self._stats["enqueued"] += 1
+            if not self._closed:
+                self._ensure_started()
+            self._cond.notify()
+        return message_id
+
+    def _run(self):
+        renew_at = time.monotonic() + self.lease / 3
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                room = self._capacity() - len(self._in_flight)
+            if time.monotonic() >= renew_at:
+                self._renew_leases()
+                renew_at = time.monotonic() + self.lease / 3
+            rows = []
+            if room > 0:
+                try:
+                    rows = self.db.claim_outbound(room, self.lease)
+                except sqlite3.Error:
+                    pass
+            for row in rows:
+                self._dispatch(row)
+            # Other processes enqueue too, so never sleep longer than the poll
+            # interval; a finished send wakes us early to claim that
+            # recipient's next message
+            timeout = 0 if 0 < len(rows) < room else self._idle_wait()
+            with self._cond:
+                if self._closed:
+                    return
+                if timeout:
+                    self._cond.wait(timeout)
+
+    def _capacity(self):
+        # Through the scheduler a send holds no thread, so a whole batch can
+        # wait on rate limits at once; otherwise claim only what the pool
+        # can start now, leaving the rest to other processes
+        if self.sender is None and "outbound_scheduler" in self.app.extensions:
+            return self.batch_size
+        return min(self.batch_size, self.workers)
+
+    def _idle_wait(self):
+        try:
+            next_due = self.db.get_next_outbound_due()
+        except sqlite3.Error:
+            return self.poll_interval
+        if next_due is None or next_due <= time.time():
+            # Nothing queued, or only messages behind one already in flight
+            return self.poll_interval
+        return min(max(next_due - time.time(), 0.01), self.poll_interval)
+
+    def _renew_leases(self):
+        # Sends wait on rate limits and retries for as long as they need to;
+        # keep their messages leased meanwhile so no other sender takes them
+        with self._cond:
+            message_ids = list(self._in_flight)
+        if not message_ids:
+            return
+        try:
+            self.db.renew_outbound_leases(message_ids, self.lease)
+        except sqlite3.Error:
+            pass
+
+    def _dispatch(self, row):
+        with self._cond:
+            self._in_flight[row["id"]] = row
+        scheduler = self.app.extensions.get("outbound_scheduler") if self.sender is None else None
+        if scheduler is not None:
+            # The scheduler paces the send; no thread here waits for it
+            future = scheduler.submit(row["payload"], row["recipient"], row["priority"])
+            future.add_done_callback(lambda future: self._complete(row, future))
+        else:
+            self._pool.submit(self._send, row)
+
+    def _send(self, row):
+        future = Future()
+        try:
+            if self.sender is not None:
+                future.set_result(self.sender(row["payload"]))
+            else:
+                future.set_result(self.app.extensions["whatsapp_client"].send(row["payload"]))
+        except Exception as e:
+            future.set_exception(e)
+        self._complete(row, future)
+
+    def _complete(self, row, future):
+        try:
+            self._deliver(row, future)
+        except Exception as e:
+            # Left leased; it is retried once the lease runs out
+            logging.error(f"Outbound message {row['id']} could not be processed: {e}")
+        finally:
+            with self._cond:
+                del self._in_flight[row["id"]]
+                self._cond.notify_all()
+
+    def _deliver(self, row, future):
+        # Imported here because whatsapp_utils imports this module
+        from app.utils.whatsapp_utils import log_outbound_message
+
+        attempts = row["attempts"] + 1
+        try:
+            response = future.result()
+        except OutboundQueueFull:
+            # The scheduler turned it away without sending; not an attempt
+            self.db.reschedule_outbound(row["id"], row["attempts"], time.time() + self.poll_interval, "scheduler full")
+            return
+        except requests.RequestException as e:
+            error, retryable = f"{type(e).__name__}: {e}", True
+        else:
+            if response.ok:
+                self.db.delete_outbound(row["id"])
+                log_outbound_message(row["payload"], response.text)
+                with self._cond:
+                    self._stats["sent"] += 1
+                return
+            error = f"HTTP {response.status_code}: {response.text[:500]}"
+            retryable = response.status_code == 429 or response.status_code >= 500
+
+        if retryable and attempts < self.max_attempts:
+            delay = self._backoff(attempts)
+            self.db.reschedule_outbound(row["id"], attempts, time.time() + delay, error)
+            with self._cond:
+                self._stats["retried"] += 1
+            logging.warning(
+                f"Outbound message {row['id']} to {row['recipient']} failed ({error}), "
+                f"retrying in {delay:.1f}s (attempt {attempts} of {self.max_attempts})"
+            )
+            return
+        self.db.dead_letter_outbound(row["id"], attempts, error)
+        with self._cond:
+            self._stats["dead_lettered"] += 1
+        logging.error(f"Outbound message {row['id']} to {row['recipient']} dead-lettered after {attempts} attempts: {error}")
+
+    def _backoff(self, attempts):
+        # Half fixed, half random, so messages that failed together spread out
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def metrics(self):
+        """Return queue depth and delivery counters."""
+        with self._cond:
+            metrics = dict(self._stats)
+        try:
+            metrics.update(self.db.get_outbound_counts())
+        except sqlite3.Error:
+            pass
+        return metrics
+
+    def shutdown(self, timeout=5):
+        """Stop the sender; anything unsent stays queued for the next start."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread, pool = self._thread, self._pool
+        if thread is None or self._pid != os.getpid():
+            return
+        thread.join(timeout)
+        pool.shutdown(wait=not thread.is_alive())
+
+
+def get_outbound_queue():
+    return current_app.extensions["outbound_queue"]
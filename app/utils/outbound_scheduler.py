@@ -0,0 +1,357 @@
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import current_app
+
+# Lower sends first: replies to a user's own message go ahead of notifications
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Graph API error code for the per-recipient ("pair") rate limit; any other
+# 429 is treated as the phone number's throughput limit
+PAIR_RATE_LIMIT_CODE = 131056
+
+
+class OutboundQueueFull(Exception):
+    """The outbound scheduler is at capacity; the message was not queued."""
+
+
+class TokenBucket:
+    """Allows `rate` sends per second on average, with bursts of up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a send is allowed; 0 if one is allowed now."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, until):
+        """Allow nothing before `until`, e.g. after a 429, and start empty."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+
+
+class _Job:
+    __slots__ = ("data", "recipient", "priority", "seq", "future", "attempts", "enqueued_at")
+
+    def __init__(self, data, recipient, priority, seq, now):
+        self.data = data
+        self.recipient = recipient
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.attempts = 0
+        self.enqueued_at = now
+
+
+class OutboundScheduler:
+    """
+    Rate-limited, prioritized queue in front of the Graph API client.
+
+    Every send takes a token from the bucket for our `PHONE_NUMBER_ID`
+    (Cloud API throughput tier) and from the recipient's bucket (the pair
+    rate limit). The next message is the highest-priority one whose recipient
+    has a token; messages for a throttled recipient wait aside without
+    holding up anyone else, and one recipient never has two messages in
+    flight, so a user receives messages in order.
+
+    A 429 pauses the bucket it refers to for the Retry-After period (or an
+    exponential backoff) and requeues the message, up to `max_attempts`.
+    `submit()` returns a Future resolving to the final `requests.Response`.
+    """
+
+    RECIPIENT_BUCKETS = 10000
+
+    def __init__(self, app=None, sender=None):
+        self.sender = sender
+        self.app = None
+        self.phone_rate = 80.0
+        self.phone_burst = 80
+        self.recipient_rate = 1 / 6
+        self.recipient_burst = 45
+        self.max_size = 10000
+        self.workers = 16
+        self.max_attempts = 5
+        self.throttle_backoff = 1.0
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread = None
+        self._pool = None
+        self._pid = None
+        self._closed = False
+        self._reset()
+        self._stats = {
+            "submitted": 0, "sent": 0, "failed": 0, "dropped": 0, "throttled": 0,
+            "recipient_deferrals": 0, "phone_waits": 0,
+            "queue_ms_total": 0.0, "queue_ms_max": 0.0,
+        }
+        self._submitted_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app)
+        app.extensions["outbound_scheduler"] = self
+        atexit.register(self.shutdown)
+
+    def configure(self, app):
+        """Take the settings from `app` without registering as its scheduler."""
+        config = app.config
+        self.app = app
+        self.phone_rate = config["OUTBOUND_PHONE_RATE"]
+        self.phone_burst = config["OUTBOUND_PHONE_BURST"]
+        self.recipient_rate = config["OUTBOUND_RECIPIENT_RATE"]
+        self.recipient_burst = config["OUTBOUND_RECIPIENT_BURST"]
+        self.max_size = config["OUTBOUND_QUEUE_SIZE"]
+        self.workers = config["OUTBOUND_WORKERS"]
+        self.max_attempts = config["OUTBOUND_MAX_ATTEMPTS"]
+        self.throttle_backoff = config["OUTBOUND_THROTTLE_BACKOFF"]
+
+    def share(self, processes):
+        """
+        Keep only this process's share of the rate limits.
+
+        Token buckets are per process, so with several server workers each
+        one gets 1/`processes` of the phone and recipient rates and bursts.
+        """
+        with self._cond:
+            self.phone_rate /= processes
+            self.phone_burst = max(1, self.phone_burst // processes)
+            self.recipient_rate /= processes
+            self.recipient_burst = max(1, self.recipient_burst // processes)
+            self._phone_bucket = TokenBucket(self.phone_rate, self.phone_burst, time.monotonic())
+            self._recipient_buckets = OrderedDict()
+
+    def _reset(self):
+        # Ready jobs as (priority, seq, job); deferred ones as (ready_at, seq, job)
+        self._ready = []
+        self._deferred = []
+        # Jobs waiting for an earlier message to the same recipient to finish
+        self._blocked = {}
+        self._busy = set()
+        self._queued = 0
+        self._in_flight = 0
+        self._phone_bucket = TokenBucket(self.phone_rate, self.phone_burst, time.monotonic())
+        self._recipient_buckets = OrderedDict()
+
+    def _ensure_started(self):
+        # Caller holds self._cond. Threads do not survive a fork, and a child
+        # must not resend what its parent had queued, so each process starts
+        # empty on first use.
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        self._pid = pid
+        self._reset()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbound-send")
+        self._thread = threading.Thread(target=self._run, name="outbound-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, data, recipient, priority=PRIORITY_INTERACTIVE):
+        """
+        Queue a serialized message payload for `recipient`.
+
+        Returns a Future. When the queue is full the Future fails at once with
+        OutboundQueueFull, so callers see backpressure instead of waiting.
+        """
+        with self._cond:
+            job = _Job(data, recipient, priority, next(self._seq), time.monotonic())
+            if not self._closed:
+                self._ensure_started()
+            if self._closed or self._queued >= self.max_size:
+                self._stats["dropped"] += 1
+                logging.warning(f"Outbound queue full, not sending to {recipient}")
+                job.future.set_exception(OutboundQueueFull(f"{self._queued} messages queued"))
+                return job.future
+            self._queued += 1
+            self._stats["submitted"] += 1
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            self._submitted_by_priority[name] = self._submitted_by_priority.get(name, 0) + 1
+            heapq.heappush(self._ready, (priority, job.seq, job))
+            self._cond.notify()
+        return job.future
+
+    def _recipient_bucket(self, recipient, now):
+        # Caller holds self._cond
+        bucket = self._recipient_buckets.get(recipient)
+        if bucket is None:
+            bucket = TokenBucket(self.recipient_rate, self.recipient_burst, now)
+            self._recipient_buckets[recipient] = bucket
+            # Forgetting an old bucket only means that recipient starts full again
+            while len(self._recipient_buckets) > self.RECIPIENT_BUCKETS:
+                self._recipient_buckets.popitem(last=False)
+        else:
+            self._recipient_buckets.move_to_end(recipient)
+        return bucket
+
+    def _run(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._deferred and self._deferred[0][0] <= now:
+                    _, _, job = heapq.heappop(self._deferred)
+                    heapq.heappush(self._ready, (job.priority, job.seq, job))
+
+                if not self._ready:
+                    if self._closed and self._queued == 0:
+                        return
+                    self._cond.wait(self._deferred[0][0] - now if self._deferred else None)
+                    continue
+                if self._in_flight >= self.workers:
+                    self._cond.wait()
+                    continue
+                phone_wait = self._phone_bucket.delay(now)
+                if phone_wait > 0:
+                    self._stats["phone_waits"] += 1
+                    self._cond.wait(phone_wait)
+                    continue
+
+                _, _, job = heapq.heappop(self._ready)
+                if job.recipient in self._busy:
+                    self._blocked.setdefault(job.recipient, deque()).append(job)
+                    continue
+                bucket = self._recipient_bucket(job.recipient, now)
+                recipient_wait = bucket.delay(now)
+                if recipient_wait > 0:
+                    self._stats["recipient_deferrals"] += 1
+                    heapq.heappush(self._deferred, (now + recipient_wait, job.seq, job))
+                    continue
+
+                bucket.take()
+                self._phone_bucket.take()
+                self._busy.add(job.recipient)
+                self._in_flight += 1
+                self._pool.submit(self._send, job)
+
+    def _send(self, job):
+        job.attempts += 1
+        try:
+            if self.sender is not None:
+                response = self.sender(job.data)
+            else:
+                response = self.app.extensions["whatsapp_client"].send(job.data)
+        except Exception as e:
+            self._finish(job, exception=e)
+            return
+        if response.status_code == 429 and job.attempts < self.max_attempts:
+            self._throttled(job, response)
+            return
+        self._finish(job, response=response)
+
+    def _throttled(self, job, response):
+        delay = self._retry_after(response, job.attempts)
+        with self._cond:
+            now = time.monotonic()
+            until = now + delay
+            self._stats["throttled"] += 1
+            if self._error_code(response) == PAIR_RATE_LIMIT_CODE:
+                self._recipient_bucket(job.recipient, now).pause(until)
+            else:
+                self._phone_bucket.pause(until)
+            heapq.heappush(self._deferred, (until, job.seq, job))
+            self._release(job.recipient)
+        logging.warning(
+            f"Graph API throttled message to {job.recipient}, retrying in {delay:.1f}s "
+            f"(attempt {job.attempts} of {self.max_attempts})"
+        )
+
+    def _retry_after(self, response, attempts):
+        try:
+            return max(float(response.headers.get("Retry-After")), 0.0)
+        except (TypeError, ValueError):
+            return self.throttle_backoff * 2 ** (attempts - 1)
+
+    @staticmethod
+    def _error_code(response):
+        try:
+            return json.loads(response.text).get("error", {}).get("code")
+        except (ValueError, AttributeError):
+            return None
+
+    def _release(self, recipient):
+        # Caller holds self._cond
+        self._in_flight -= 1
+        self._busy.discard(recipient)
+        blocked = self._blocked.pop(recipient, None)
+        if blocked:
+            for job in blocked:
+                heapq.heappush(self._ready, (job.priority, job.seq, job))
+        self._cond.notify()
+
+    def _finish(self, job, response=None, exception=None):
+        with self._cond:
+            waited_ms = (time.monotonic() - job.enqueued_at) * 1000
+            self._queued -= 1
+            self._stats["queue_ms_total"] += waited_ms
+            self._stats["queue_ms_max"] = max(self._stats["queue_ms_max"], waited_ms)
+            if exception is None and response.ok:
+                self._stats["sent"] += 1
+            else:
+                self._stats["failed"] += 1
+            self._release(job.recipient)
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(response)
+
+    def metrics(self):
+        """Return queue depth, throttling and latency counters."""
+        with self._cond:
+            now = time.monotonic()
+            completed = self._stats["sent"] + self._stats["failed"]
+            metrics = {
+                key: value for key, value in self._stats.items() if key != "queue_ms_total"
+            }
+            metrics.update(
+                submitted_by_priority=dict(self._submitted_by_priority),
+                queued=self._queued,
+                ready=len(self._ready),
+                deferred=len(self._deferred),
+                in_flight=self._in_flight,
+                capacity=self.max_size,
+                queue_ms_avg=self._stats["queue_ms_total"] / completed if completed else 0.0,
+                phone_paused_for=max(self._phone_bucket.paused_until - now, 0.0),
+            )
+            return metrics
+
+    def shutdown(self, timeout=5):
+        """Stop accepting messages and wait up to `timeout` for queued ones to go out."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread, pool = self._thread, self._pool
+        if thread is None or self._pid != os.getpid():
+            return
+        thread.join(timeout)
+        pool.shutdown(wait=not thread.is_alive())
+
+
+def get_outbound_scheduler():
+    return current_app.extensions["outbound_scheduler"]
@@ -0,0 +1,111 @@
+class InboundMessage:
+    """A single user message from a webhook `messages[]` array."""
+
+    __slots__ = ("id", "wa_id", "name", "type", "timestamp", "phone_number_id", "raw")
+
+    def __init__(self, raw, name=None, phone_number_id=None):
+        self.raw = raw
+        self.id = raw.get("id")
+        self.wa_id = raw.get("from")
+        self.name = name
+        self.type = raw.get("type")
+        self.timestamp = raw.get("timestamp")
+        self.phone_number_id = phone_number_id
+
+    @property
+    def text(self):
+        """Body of a text message, or None for other types."""
+        text = self.raw.get("text")
+        return text.get("body") if isinstance(text, dict) else None
+
+    @property
+    def interactive(self):
+        """The `interactive` object of an interactive reply, or None."""
+        return self.raw.get("interactive")
+
+    def __repr__(self):
+        return f"InboundMessage(id={self.id!r}, wa_id={self.wa_id!r}, type={self.type!r})"
+
+
+class StatusUpdate:
+    """A delivery receipt (sent/delivered/read/failed) from a webhook `statuses[]` array."""
+
+    __slots__ = ("id", "status", "recipient_id", "timestamp", "phone_number_id", "errors")
+
+    def __init__(self, raw, phone_number_id=None):
+        self.id = raw.get("id")
+        self.status = raw.get("status")
+        self.recipient_id = raw.get("recipient_id")
+        self.timestamp = raw.get("timestamp")
+        self.phone_number_id = phone_number_id
+        self.errors = raw.get("errors")
+
+    def __repr__(self):
+        return f"StatusUpdate(id={self.id!r}, status={self.status!r})"
+
+
+class WebhookEvent:
+    """Every message and status carried by one webhook request."""
+
+    __slots__ = ("object", "messages", "statuses")
+
+    def __init__(self, object=None, messages=None, statuses=None):
+        self.object = object
+        self.messages = messages if messages is not None else []
+        self.statuses = statuses if statuses is not None else []
+
+    def __repr__(self):
+        return f"WebhookEvent(messages={len(self.messages)}, statuses={len(self.statuses)})"
+
+
+def _dicts(items):
+    """The dict items of a JSON array; anything else in it, or a non-array, yields nothing."""
+    if isinstance(items, list):
+        return [item for item in items if isinstance(item, dict) and item]
+    return ()
+
+
+def _dict(value):
+    return value if isinstance(value, dict) else {}
+
+
+def _is_message(raw):
+    """A message needs string `id`, `from` and `type` to be deduplicated, logged and routed."""
+    return all(isinstance(raw.get(key), str) and raw.get(key) for key in ("id", "from", "type"))
+
+
+def parse_webhook(body):
+    """
+    Turn a webhook body into a WebhookEvent in a single pass.
+
+    Meta may batch several entries, changes, messages and statuses into one
+    request; all of them are collected, in delivery order. Malformed parts
+    (wrong types, missing objects, messages without a string id, sender or
+    type) are skipped rather than raising.
+    """
+    event = WebhookEvent(object=body.get("object") if isinstance(body, dict) else None)
+    if event.object is None:
+        return event
+
+    for entry in _dicts(body.get("entry")):
+        for change in _dicts(entry.get("changes")):
+            value = change.get("value")
+            if not value or not isinstance(value, dict):
+                continue
+            phone_number_id = _dict(value.get("metadata")).get("phone_number_id")
+
+            messages = [raw for raw in _dicts(value.get("messages")) if _is_message(raw)]
+            if messages:
+                names = {
+                    contact.get("wa_id"): _dict(contact.get("profile")).get("name")
+                    for contact in _dicts(value.get("contacts"))
+                    if isinstance(contact.get("wa_id"), str)
+                }
+                for raw in messages:
+                    event.messages.append(
+                        InboundMessage(raw, names.get(raw.get("from")), phone_number_id)
+                    )
+
+            for raw in _dicts(value.get("statuses")):
+                event.statuses.append(StatusUpdate(raw, phone_number_id))
+    return event
@@ -0,0 +1,91 @@
+import os
+import threading
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class WhatsAppClient:
+    """
+    Reusable Graph API client with a pooled keep-alive session.
+
+    The messages URL and auth headers are built once from the app config, and
+    every send goes through the same connection pool instead of paying for a
+    new TCP+TLS handshake to graph.facebook.com.
+    """
+
+    def __init__(self, app=None):
+        self.url = None
+        self.headers = None
+        self.timeout = 10
+        self.pool_size = 10
+        self.max_retries = 3
+        self.backoff_factor = 0.5
+        self.retry_statuses = (429, 500, 502, 503, 504)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.url = f"https://graph.facebook.com/{config['VERSION']}/{config['PHONE_NUMBER_ID']}/messages"
+        self.headers = {
+            "Content-type": "application/json",
+            "Authorization": f"Bearer {config['ACCESS_TOKEN']}",
+        }
+        self.timeout = config["GRAPH_TIMEOUT"]
+        self.pool_size = config["GRAPH_POOL_SIZE"]
+        self.max_retries = config["GRAPH_MAX_RETRIES"]
+        self.backoff_factor = config["GRAPH_BACKOFF_FACTOR"]
+        if config["OUTBOUND_SCHEDULER"]:
+            # The scheduler handles 429s by pausing the whole bucket, rather
+            # than one thread sleeping through retries
+            self.retry_statuses = (500, 502, 503, 504)
+        app.extensions["whatsapp_client"] = self
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=frozenset(["POST"]),
+            respect_retry_after_header=True,
+            # Hand the last response back so the caller sees the real status
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def session(self):
+        # Sockets must not be shared with a forked child, so each process
+        # builds its own session on first use.
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def send(self, data):
+        """POST a serialized message payload to the Graph API messages endpoint."""
+        return self.session.post(self.url, data=data, timeout=self.timeout)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def get_whatsapp_client():
+    return current_app.extensions["whatsapp_client"]
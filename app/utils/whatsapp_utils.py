@@ -1,7 +1,15 @@
+import contextvars
 import logging
 from flask import current_app, jsonify
 import json
+import aiohttp
+import asyncio
 import requests
+from app.utils.whatsapp_client import get_whatsapp_client
+from app.utils.async_whatsapp_client import get_async_whatsapp_client
+from app.utils.dedup import get_dedup_cache
+from app.utils.outbound_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, get_outbound_scheduler
+from app.utils.outbound_queue import get_outbound_queue
 from app.utils.messages import (
     get_greetings_message_input, 
     get_text_message_input, 
@@ -13,7 +21,7 @@ from app.utils.messages import (
 )
 # from app.services.openai_service import generate_response
 import re
-from app.data import storage
+from app.data import storage, message_log, delivery_status
 
 
 def log_http_response(response):
@@ -26,18 +34,131 @@ def generate_response(response):
     return response.upper()
 
 
-def send_message(data):
-    headers = {
-        "Content-type": "application/json",
-        "Authorization": f"Bearer {current_app.config['ACCESS_TOKEN']}",
-    }
+def log_outbound_message(data, response_body=None):
+    payload = json.loads(data)
+    wa_message_id = None
+    if response_body:
+        # The Graph API answers with the wamid that status callbacks refer to
+        messages = json.loads(response_body).get("messages") or [{}]
+        wa_message_id = messages[0].get("id")
+    message_log.log(payload["to"], payload["type"], data, "outbound", wa_message_id)
 
-    url = f"https://graph.facebook.com/{current_app.config['VERSION']}/{current_app.config['PHONE_NUMBER_ID']}/messages"
 
+def log_inbound_message(message):
+    if message.type == "text":
+        content = message.text
+    elif message.type == "interactive":
+        content = json.dumps(message.interactive)
+    else:
+        content = None
+    message_log.log(message.wa_id, message.type, content, "inbound", message.id)
+
+
+def submit_message(data):
+    """
+    Hand a message to the asyncio client without waiting for the Graph API.
+
+    Returns a concurrent.futures.Future resolving to (status, body).
+    """
+    def log_result(future):
+        try:
+            status, body = future.result()
+        except Exception as e:
+            logging.error(f"Async request failed due to: {e}")
+            return
+        logging.info(f"Status: {status}")
+        logging.info(f"Body: {body}")
+        log_outbound_message(data, body)
+
+    future = get_async_whatsapp_client().submit(data)
+    future.add_done_callback(log_result)
+    return future
+
+
+def schedule_message(data, priority=PRIORITY_INTERACTIVE):
+    """
+    Queue a message on the rate-limited outbound scheduler.
+
+    Returns a concurrent.futures.Future resolving to the Graph API response.
+    """
+    def log_result(future):
+        try:
+            response = future.result()
+        except Exception as e:
+            logging.error(f"Scheduled request failed due to: {e}")
+            return
+        log_http_response(response)
+        if response.ok:
+            log_outbound_message(data, response.text)
+        else:
+            logging.error(f"Scheduled request failed with status {response.status_code}")
+
+    recipient = json.loads(data)["to"]
+    future = get_outbound_scheduler().submit(data, recipient, priority)
+    future.add_done_callback(log_result)
+    return future
+
+
+def enqueue_message(data, priority=PRIORITY_INTERACTIVE):
+    """
+    Commit a message to the durable outbound queue and return its queue id.
+
+    Background workers send it and retry failures, so a Graph API timeout
+    or network error no longer loses the message.
+    """
+    message_id = get_outbound_queue().enqueue(data, priority)
+    logging.info(f"Queued outbound message {message_id}")
+    return message_id
+
+
+# Set while a handler runs for the async webhook server: send_message() then
+# collects payloads here for the server to await, instead of sending them
+_outbox = contextvars.ContextVar("outbox", default=None)
+
+
+def collect_outbound(handler, *args):
+    """
+    Run a synchronous handler and return the payloads it sent, unsent.
+
+    Messages that go to the durable queue or the outbound scheduler are handed
+    over as usual; only direct Graph API sends are collected.
+    """
+    outbox = []
+    token = _outbox.set(outbox)
     try:
-        response = requests.post(
-            url, data=data, headers=headers, timeout=10
-        )  # 10 seconds timeout as an example
+        handler(*args)
+    finally:
+        _outbox.reset(token)
+    return outbox
+
+
+async def send_messages_async(client, payloads):
+    """Await the sends for one webhook in order, logging each like send_message()."""
+    for data in payloads:
+        try:
+            status, body = await client.send(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Async request failed due to: {e}")
+            continue
+        logging.info(f"Status: {status}")
+        logging.info(f"Body: {body}")
+        log_outbound_message(data, body)
+
+
+def send_message(data, priority=PRIORITY_INTERACTIVE):
+    if current_app.config["DURABLE_QUEUE"]:
+        return enqueue_message(data, priority)
+    if current_app.config["OUTBOUND_SCHEDULER"]:
+        return schedule_message(data, priority)
+    outbox = _outbox.get()
+    if outbox is not None:
+        outbox.append(data)
+        return None
+    if current_app.config["GRAPH_ASYNC_SEND"]:
+        return submit_message(data)
+
+    try:
+        response = get_whatsapp_client().send(data)
         response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
     except requests.Timeout:
         logging.error("Timeout occurred while sending message")
@@ -50,6 +171,7 @@ def send_message(data):
     else:
         # Process the response as normal
         log_http_response(response)
+        log_outbound_message(data, response.text)
         return response
 
 
@@ -71,25 +193,57 @@ def process_text_for_whatsapp(text):
     return whatsapp_style_text
 
 
-def process_whatsapp_message(body):
-    wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
-    name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
+def process_status_updates(statuses):
+    """
+    Record delivery receipts without touching storage per callback.
 
-    message = body["entry"][0]["changes"][0]["value"]["messages"][0]
-    # message_body = message["text"]["body"]
+    Statuses are coalesced per message id in memory and flushed in batches.
+    """
+    for status in statuses:
+        # Anything but strings here is a malformed callback
+        if status.id and isinstance(status.id, str) and isinstance(status.status, str):
+            delivery_status.record(status.id, status.status)
+
+
+def process_webhook_event(event):
+    """Handle every message in a parsed webhook, in delivery order."""
+    dedup = get_dedup_cache()
+    for message in event.messages:
+        # Redeliveries are dropped before any outbound call or status update
+        if message.id and _seen(dedup, message.id):
+            logging.info(f"Skipping duplicate message {message.id}")
+            continue
+        try:
+            process_whatsapp_message(message)
+        except Exception as e:
+            # One bad message must not drop the rest of the batch
+            logging.error(f"Error processing message {message.id}: {e}")
+
+
+def _seen(dedup, message_id):
+    try:
+        return dedup.seen(message_id)
+    except Exception as e:
+        # e.g. the persistent tier's storage is unavailable; answering twice
+        # beats dropping the message
+        logging.error(f"Dedup check failed for message {message_id}, handling it anyway: {e}")
+        return False
+
+
+def process_whatsapp_message(message):
+    log_inbound_message(message)
 
     # TODO: implement custom function here
-    data = None
-    if message["type"] == "interactive":
+    if message.type == "interactive":
         handle_interactive_message(message)
-    elif message["type"] == "text":
+    elif message.type == "text":
         handle_text_message(message)
     else:
-        logging.error(f"Unsupported message type: {message['type']}")
+        logging.error(f"Unsupported message type: {message.type}")
         handle_retry_message(message)
 
 def handle_text_message(message):
-    response = generate_response(message["text"]["body"])
+    response = generate_response(message.text)
     if response.upper() == "MENU":
         data = get_menu_message_input(current_app.config["RECIPIENT_WAID"])
     elif response.upper() == "HI":
@@ -99,33 +253,27 @@ def handle_text_message(message):
     send_message(data)
 
 def handle_interactive_message(message):
-    interactive = message["interactive"]
+    interactive = message.interactive
     if interactive["type"] == "list_reply":
-        handle_list_reply(interactive)
+        handle_list_reply(message)
     else:
         logging.error(f"Unsupported interactive type: {interactive['type']}")
         handle_retry_message(message)
 
-def is_valid_whatsapp_message(body):
+def is_valid_whatsapp_message(event):
     """
-    Check if the incoming webhook event has a valid WhatsApp message structure.
+    Check if the parsed webhook event carries at least one WhatsApp message.
     """
-    return (
-        body.get("object")
-        and body.get("entry")
-        and body["entry"][0].get("changes")
-        and body["entry"][0]["changes"][0].get("value")
-        and body["entry"][0]["changes"][0]["value"].get("messages")
-        and body["entry"][0]["changes"][0]["value"]["messages"][0]
-    )
+    return bool(event.object and event.messages)
 
 def handle_retry_message(message):
     response = generate_response("Please try again")
     data = get_text_message_input(current_app.config["RECIPIENT_WAID"], response)
     send_message(data)
 
-def handle_list_reply(interactive):
-    list_reply = interactive["list_reply"]
+def handle_list_reply(message):
+    list_reply = message.interactive["list_reply"]
+    wa_id = message.wa_id
     if list_reply["id"] == "1":
         data = get_text_message_input(current_app.config["RECIPIENT_WAID"], list_reply["title"] + " selected")
         send_message(data)
@@ -133,10 +281,15 @@ def handle_list_reply(interactive):
         data = get_text_message_input(current_app.config["RECIPIENT_WAID"], list_reply["title"] + " selected")
         send_message(data)
     elif list_reply["id"] == "initiateTrade":
-        data = get_raise_trade_message_input(current_app.config["RECIPIENT_WAID"])
+        data = get_raise_trade_message_input(current_app.config["RECIPIENT_WAID"], wa_id)
         send_message(data)
     elif list_reply["id"] == "viewTradeHistory":
-        data = get_view_trade_history_message_input(current_app.config["RECIPIENT_WAID"])
+        data = get_view_trade_history_message_input(current_app.config["RECIPIENT_WAID"], wa_id=wa_id)
+        send_message(data)
+    elif list_reply["id"].startswith("viewTradeHistory_"):
+        # "Next page" row; the suffix is the keyset cursor
+        cursor = list_reply["id"].split("_")[1]
+        data = get_view_trade_history_message_input(current_app.config["RECIPIENT_WAID"], cursor, wa_id)
         send_message(data)
     elif list_reply["id"].find("viewTrade_") != -1:
         data = get_trade_details_message_input(current_app.config["RECIPIENT_WAID"], list_reply["id"])
@@ -157,6 +310,7 @@ def handle_list_reply(interactive):
 
 def handle_trade_details_message(person_name, trade_id, product_name, quantity, price):
     data = get_approve_trade_message_input(current_app.config["APPROVER_WAID"], trade_id, person_name, product_name, quantity, price)
-    send_message(data)
+    # A notification to the approver, so it yields to replies users are waiting on
+    send_message(data, priority=PRIORITY_BULK)
 
 
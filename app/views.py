@@ -3,13 +3,20 @@ import json
 
 from flask import Blueprint, request, jsonify, current_app, render_template
 
-from .decorators.security import signature_required
+from .decorators.security import signature_required, get_verified_json
 from .utils.whatsapp_utils import (
-    process_whatsapp_message,
+    process_webhook_event,
+    process_status_updates,
     is_valid_whatsapp_message,
     handle_trade_details_message
 )
-from .data import storage
+from .utils.dispatch import get_dispatcher
+from .utils.dedup import get_dedup_cache
+from .utils.outbound_scheduler import get_outbound_scheduler
+from .utils.outbound_queue import get_outbound_queue
+from .utils.webhook_events import parse_webhook
+from .data import storage, delivery_status
+from .services.openai_service import get_openai_metrics
 
 webhook_blueprint = Blueprint("webhook", __name__)
 
@@ -28,23 +35,30 @@ def handle_message():
     Returns:
         response: A tuple containing a JSON response and an HTTP status code.
     """
-    body = request.get_json()
+    body = get_verified_json()
     # logging.info(f"request body: {body}")
-
-    # Check if it's a WhatsApp status update
-    if (
-        body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("statuses")
-    ):
-        logging.info("Received a WhatsApp status update.")
-        return jsonify({"status": "ok"}), 200
+    try:
+        event = parse_webhook(body)
+    except (AttributeError, TypeError, ValueError) as e:
+        logging.error(f"Malformed webhook body: {e}")
+        return jsonify({"status": "error", "message": "Invalid webhook payload"}), 400
+
+    # Status updates (sent/delivered/read) only touch an in-memory buffer,
+    # so they are handled inline even when messages go to the dispatcher
+    if event.statuses:
+        process_status_updates(event.statuses)
+        if not event.messages:
+            return jsonify({"status": "ok"}), 200
 
     try:
-        if is_valid_whatsapp_message(body):
+        if is_valid_whatsapp_message(event):
             logging.info(f"request body: {body}")
-            process_whatsapp_message(body)
+            if current_app.config["WEBHOOK_ASYNC"]:
+                # Acknowledge right away; a worker sends the reply
+                if not get_dispatcher().submit(event):
+                    return jsonify({"status": "error", "message": "Queue full"}), 503
+            else:
+                process_webhook_event(event)
             return jsonify({"status": "ok"}), 200
         else:
             # if the request is not a WhatsApp API event, return an error
@@ -57,27 +71,40 @@ def handle_message():
         return jsonify({"status": "error", "message": "Invalid JSON provided"}), 400
 
 
-# Required webhook verifictaion for WhatsApp
-def verify():
+def check_verification(params, verify_token):
+    """
+    Answer Meta's webhook verification request.
+
+    Returns (body, status): the challenge string on success, otherwise an
+    error dict. Shared by the Flask view and the async server.
+    """
     # Parse params from the webhook verification request
-    mode = request.args.get("hub.mode")
-    token = request.args.get("hub.verify_token")
-    challenge = request.args.get("hub.challenge")
+    mode = params.get("hub.mode")
+    token = params.get("hub.verify_token")
+    challenge = params.get("hub.challenge")
     # Check if a token and mode were sent
     if mode and token:
         # Check the mode and token sent are correct
-        if mode == "subscribe" and token == current_app.config["VERIFY_TOKEN"]:
+        if mode == "subscribe" and token == verify_token:
             # Respond with 200 OK and challenge token from the request
             logging.info("WEBHOOK_VERIFIED")
             return challenge, 200
         else:
             # Responds with '403 Forbidden' if verify tokens do not match
             logging.info("VERIFICATION_FAILED")
-            return jsonify({"status": "error", "message": "Verification failed"}), 403
+            return {"status": "error", "message": "Verification failed"}, 403
     else:
         # Responds with '400 Bad Request' if verify tokens do not match
         logging.info("MISSING_PARAMETER")
-        return jsonify({"status": "error", "message": "Missing parameters"}), 400
+        return {"status": "error", "message": "Missing parameters"}, 400
+
+
+# Required webhook verifictaion for WhatsApp
+def verify():
+    body, status = check_verification(request.args, current_app.config["VERIFY_TOKEN"])
+    if isinstance(body, dict):
+        return jsonify(body), status
+    return body, status
 
 
 @webhook_blueprint.route("/webhook", methods=["GET"])
@@ -89,10 +116,26 @@ def webhook_get():
 def webhook_post():
     return handle_message()
 
+@webhook_blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose runtime counters for the background components."""
+    data = {
+        "dedup_cache": get_dedup_cache().metrics(),
+        "delivery_status": delivery_status.metrics(),
+        "openai": get_openai_metrics(),
+    }
+    if current_app.config["WEBHOOK_ASYNC"]:
+        data["webhook_dispatcher"] = get_dispatcher().metrics()
+    if current_app.config["OUTBOUND_SCHEDULER"]:
+        data["outbound_scheduler"] = get_outbound_scheduler().metrics()
+    if current_app.config["DURABLE_QUEUE"]:
+        data["outbound_queue"] = get_outbound_queue().metrics()
+    return jsonify(data), 200
+
 @webhook_blueprint.route("/", methods=["GET"])
 def show_order_form():
     """Display the order form."""
-    return render_template("order_form.html")
+    return render_template("order_form.html", wa_id=request.args.get("wa_id", ""))
 
 @webhook_blueprint.route("/submit-order", methods=["POST"])
 def handle_order():
@@ -102,12 +145,13 @@ def handle_order():
         product_name = request.form.get("product_name")
         quantity = request.form.get("quantity")
         price = request.form.get("price")
+        wa_id = request.form.get("wa_id") or None
         
         # Log the order details
         logging.info(f"New order received - Person: {person_name}, Product: {product_name}, Quantity: {quantity}, Price: {price}")
         
         # Store the trade in the JSON storage
-        trade_id = storage.add_trade(person_name, product_name, quantity, price)
+        trade_id = storage.add_trade(person_name, product_name, quantity, price, wa_id)
         
         # Send trade details to approver via WhatsApp
         handle_trade_details_message(person_name, trade_id, product_name, quantity, price)
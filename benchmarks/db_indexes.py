@@ -0,0 +1,100 @@
+"""
+Time the SQLite trade and message queries before and after the index migrations.
+
+Builds a database at schema version 1 (no secondary indexes) with `--rows`
+trades and messages and times each query there, after migration 2 and after
+the latest migration. The queries are the ones DatabaseManager runs, imported from
+app/data/db_manager.py, so the numbers track the code.
+
+    python benchmarks/db_indexes.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.data.db_manager import (  # noqa: E402
+    MAX_ROWID,
+    SELECT_MESSAGE_HISTORY,
+    SELECT_TRADES_BY_STATUS,
+    SELECT_TRADES_PAGE_BY_STATUS,
+)
+from app.data.migrations import MIGRATIONS, get_schema_version, run_migrations  # noqa: E402
+
+# Most trades have been handled; the open ones are the ones people list
+STATUSES = ["accepted"] * 60 + ["rejected"] * 39 + ["pending"]
+
+
+def populate(conn, rows, contacts):
+    rng = random.Random(42)
+    base = time.time() - rows
+    with conn:
+        conn.executemany(
+            "INSERT INTO trades (person_name, product_name, quantity, price, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))",
+            ((f"person {i % contacts}", f"product {i % 500}", rng.randint(1, 100), rng.uniform(1, 1000),
+              rng.choice(STATUSES), base + i) for i in range(rows)),
+        )
+        conn.executemany(
+            "INSERT INTO messages (wa_id, message_type, message_content, direction, created_at) "
+            "VALUES (?, 'text', ?, ?, datetime(?, 'unixepoch'))",
+            ((f"{rng.randrange(contacts):010d}", f"message {i}", rng.choice(("inbound", "outbound")), base + i)
+             for i in range(rows)),
+        )
+
+
+def queries(contacts):
+    # (label, sql, params): each is what the named DatabaseManager method executes
+    return [
+        ("get_all_trades('pending')", SELECT_TRADES_BY_STATUS, ("pending",)),
+        ("get_trades_page('pending', 9)", SELECT_TRADES_PAGE_BY_STATUS, ("pending", MAX_ROWID, 10)),
+        ("get_message_history(wa_id, 50)", SELECT_MESSAGE_HISTORY, (f"{contacts // 2:010d}", 50)),
+    ]
+
+
+def measure(conn, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        timings.append(time.perf_counter() - start)
+    plan = " / ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+    return statistics.mean(timings) * 1000, len(rows), plan
+
+
+def report(conn, contacts, repeat):
+    print(f"schema version {get_schema_version(conn)}")
+    for label, sql, params in queries(contacts):
+        ms, count, plan = measure(conn, sql, params, repeat)
+        print(f"  {label:<32} {ms:9.2f} ms  {count:>7} rows  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="trades and messages to insert")
+    parser.add_argument("--contacts", type=int, default=10_000, help="distinct wa_ids")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        run_migrations(conn, MIGRATIONS[:1])
+        start = time.perf_counter()
+        populate(conn, args.rows, args.contacts)
+        print(f"inserted {args.rows} trades and messages in {time.perf_counter() - start:.1f} s")
+        report(conn, args.contacts, args.repeat)
+        # Migration 2 added the status and wa_id indexes, 3 the keyset one
+        for migrations in (MIGRATIONS[:2], MIGRATIONS):
+            run_migrations(conn, migrations)
+            report(conn, args.contacts, args.repeat)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
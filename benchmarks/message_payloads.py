@@ -0,0 +1,99 @@
+"""
+Time the message payload builders in app/utils/messages.py.
+
+With `--baseline REV` the same builders are also loaded from that git
+revision (e.g. the commit before the precompiled templates), checked to give
+identical output on random inputs, and timed alongside.
+
+    python benchmarks/message_payloads.py --baseline <rev>
+"""
+import argparse
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from app.utils import messages  # noqa: E402
+
+# Builders that only format their arguments; the trade list and history ones
+# spend their time in storage instead
+CASES = [
+    ("get_text_message_input", ("15551234567", "Your trade has been approved.")),
+    ("get_menu_message_input", ("15551234567",)),
+    ("get_greetings_message_input", ("15551234567",)),
+    ("get_approve_trade_message_input", ("15551234567", 42, "Ana", "Copper wire", 12, 99.5)),
+]
+
+SAMPLE_TEXT = 'ab"\\\n\t\x00é€😀 <>&'
+
+
+def load_revision(rev):
+    """Import app/utils/messages.py as it was at git revision `rev`."""
+    source = subprocess.run(
+        ["git", "show", f"{rev}:app/utils/messages.py"], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    path = os.path.join(tempfile.mkdtemp(), "messages_baseline.py")
+    with open(path, "w") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("messages_baseline", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def random_text(rng):
+    return "".join(rng.choice(SAMPLE_TEXT) for _ in range(rng.randrange(40)))
+
+
+def check_identical(baseline, rounds, rng):
+    for _ in range(rounds):
+        recipient = rng.choice([random_text(rng), None, rng.randrange(10 ** 12)])
+        args = {
+            "get_text_message_input": (recipient, random_text(rng)),
+            "get_menu_message_input": (recipient,),
+            "get_greetings_message_input": (recipient,),
+            "get_approve_trade_message_input": (
+                recipient, rng.randrange(1000), random_text(rng), random_text(rng),
+                rng.randrange(100), rng.uniform(0, 1000),
+            ),
+        }
+        for name, call_args in args.items():
+            expected = getattr(baseline, name)(*call_args)
+            actual = getattr(messages, name)(*call_args)
+            if expected != actual:
+                raise SystemExit(f"{name}{call_args!r} differs:\n  {expected}\n  {actual}")
+    print(f"output identical to the baseline on {rounds} random inputs per builder")
+
+
+def per_call_us(func, args, number):
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--number", type=int, default=100_000, help="calls per timing run")
+    parser.add_argument("--check", type=int, default=2000, help="random inputs to compare per builder")
+    args = parser.parse_args()
+
+    baseline = load_revision(args.baseline) if args.baseline else None
+    if baseline is not None:
+        check_identical(baseline, args.check, random.Random(0))
+
+    for name, call_args in CASES:
+        current = per_call_us(getattr(messages, name), call_args, args.number)
+        if baseline is None:
+            print(f"  {name:<34} {current:7.2f} us")
+        else:
+            before = per_call_us(getattr(baseline, name), call_args, args.number)
+            print(f"  {name:<34} {before:7.2f} us -> {current:7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
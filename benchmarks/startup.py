@@ -0,0 +1,101 @@
+"""
+Time app startup and the first storage call against a large JSON data file.
+
+Each revision is checked out into a temporary git worktree holding a generated
+app/data/development_data.json, so the working tree and its data are never
+touched. Every measurement is a fresh interpreter: importing `app` and calling
+create_app(), then the first `storage.get_trade()`, which is where the JSON
+file is loaded since storage became lazy.
+
+    python benchmarks/startup.py --rev <before> --rev HEAD
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PROBE = """
+import time
+start = time.perf_counter()
+from app import create_app
+create_app()
+created = time.perf_counter()
+from app.data import storage
+storage.get_trade(1)
+first_use = time.perf_counter()
+print(f"{(created - start) * 1000:.1f} {(first_use - start) * 1000:.1f}")
+"""
+
+
+def write_data_file(path, trades, messages):
+    rng = random.Random(0)
+    data = {
+        "trades": [
+            {
+                "id": i, "wa_id": f"{rng.randrange(10 ** 10):010d}", "person_name": f"person {i}",
+                "product_name": f"product {i % 500}", "quantity": rng.randint(1, 100),
+                "price": round(rng.uniform(1, 1000), 2), "status": rng.choice(("pending", "accepted", "rejected")),
+                "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00",
+            }
+            for i in range(1, trades + 1)
+        ],
+        "messages": [
+            {
+                "id": i, "wa_message_id": f"wamid.{i}", "wa_id": f"{rng.randrange(10 ** 4):010d}",
+                "message_type": "text", "message_content": "lorem ipsum " * rng.randint(1, 20),
+                "direction": rng.choice(("inbound", "outbound")), "status": "read",
+                "created_at": "2024-01-01T00:00:00",
+            }
+            for i in range(1, messages + 1)
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def measure(tree, runs):
+    env = {**os.environ, "STORAGE_BACKEND": "json", "OPENAI_API_KEY": "benchmark"}
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=tree, env=env, capture_output=True, text=True, check=True
+        )
+        samples.append([float(value) for value in out.stdout.split()[-2:]])
+    return statistics.median(s[0] for s in samples), statistics.median(s[1] for s in samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rev", action="append", help="git revision to measure (repeatable, default HEAD)")
+    parser.add_argument("--trades", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--runs", type=int, default=7, help="fresh processes per revision; the median is shown")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    data_file = os.path.join(tmp, "development_data.json")
+    write_data_file(data_file, args.trades, args.messages)
+    print(f"data file: {os.path.getsize(data_file) / 1e6:.0f} MB, {args.trades} trades, {args.messages} messages")
+    try:
+        for rev in args.rev or ["HEAD"]:
+            tree = os.path.join(tmp, f"tree-{len(os.listdir(tmp))}")
+            subprocess.run(["git", "worktree", "add", "--detach", "-q", tree, rev], cwd=ROOT, check=True)
+            try:
+                shutil.copy(data_file, os.path.join(tree, "app", "data", "development_data.json"))
+                created, first_use = measure(tree, args.runs)
+                print(f"  {rev:<12} create_app {created:7.0f} ms   until first storage call {first_use:7.0f} ms")
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=ROOT, check=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
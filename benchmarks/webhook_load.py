@@ -0,0 +1,175 @@
+"""
+Load-test POST /webhook with signed requests against a fake Graph API.
+
+Starts a fake Graph API that answers every send after `--graph-latency`
+seconds, then the app with the chosen `--server` (aiohttp, gunicorn or
+threaded) in one process with SQLite storage, pointed at the fake API. It then
+posts `--requests` signed text-message webhooks, `--concurrency` at a time,
+and reports throughput and latency. Both servers are stopped at the end.
+
+    python benchmarks/webhook_load.py --server aiohttp --concurrency 1000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+APP_SECRET = "load-test-secret"
+
+
+def serve_graph(port, latency):
+    """Answer every message send like the Graph API, after `latency` seconds."""
+    from aiohttp import web
+
+    ids = itertools.count()
+
+    async def send(request):
+        await request.read()
+        await asyncio.sleep(latency)
+        return web.json_response({"messages": [{"id": f"wamid.load{next(ids)}"}]})
+
+    app = web.Application()
+    app.router.add_post("/{tail:.*}", send)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None, backlog=4096)
+
+
+def serve_app(server, port, graph_port, db_path):
+    """Run the app the way run.py does, with its Graph API clients sent to the fake."""
+    import logging
+
+    os.environ.update(
+        APP_SECRET=APP_SECRET, ACCESS_TOKEN="load-test", VERSION="v18.0", PHONE_NUMBER_ID="1",
+        RECIPIENT_WAID="15550000000", STORAGE_BACKEND="sqlite", SQLITE_DB_PATH=db_path,
+        SERVER=server, SERVER_HOST="127.0.0.1", SERVER_PORT=str(port), SERVER_WORKERS="1",
+        GRAPH_POOL_SIZE="100", GRAPH_ASYNC_CONCURRENCY="1000",
+    )
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import run
+
+    logging.getLogger().setLevel(logging.WARNING)
+    url = f"http://127.0.0.1:{graph_port}/v18.0/1/messages"
+    run.app.extensions["whatsapp_client"].url = url
+    run.app.extensions["async_whatsapp_client"].url = url
+    if server == "aiohttp":
+        from aiohttp import web
+
+        from app.async_app import create_async_app
+
+        web.run_app(create_async_app(run.app), host="127.0.0.1", port=port, print=None, access_log=None,
+                    backlog=4096)
+    elif server == "gunicorn":
+        run.run_gunicorn()
+    else:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        run.app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def webhook_body(i):
+    wa_id = f"31{i:09d}"
+    return json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {
+            "contacts": [{"wa_id": wa_id, "profile": {"name": "Load Test"}}],
+            "messages": [{"from": wa_id, "id": f"wamid.{uuid.uuid4().hex}", "type": "text",
+                          "text": {"body": "hello"}}],
+        }}]}],
+    }).encode()
+
+
+async def drive(port, total, concurrency):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def post(i):
+            nonlocal errors
+            body = webhook_body(i)
+            signature = "sha256=" + hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers = {"X-Hub-Signature-256": signature, "Content-Type": "application/json"}
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"http://127.0.0.1:{port}/webhook", data=body, headers=headers) as r:
+                        await r.read()
+                        errors += r.status != 200
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies, errors
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Nothing listening on port {port} after {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server", choices=("aiohttp", "gunicorn", "threaded"), default="aiohttp")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--graph-latency", type=float, default=0.2, help="seconds per fake Graph API send")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    graph_port, app_port = free_port(), free_port()
+    children = [
+        subprocess.Popen([sys.executable, __file__, "_graph", str(graph_port), str(args.graph_latency)]),
+        subprocess.Popen([sys.executable, __file__, "_app", args.server, str(app_port), str(graph_port),
+                          os.path.join(tmp, "load.db")]),
+    ]
+    try:
+        wait_for_port(graph_port)
+        wait_for_port(app_port)
+        elapsed, latencies, errors = asyncio.run(drive(app_port, args.requests, args.concurrency))
+    finally:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.wait(30)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{args.server}: {args.requests} requests, concurrency {args.concurrency}: {elapsed:.2f} s, "
+        f"{args.requests / elapsed:.0f} req/s, p50 {p50:.0f} ms, p99 {p99:.0f} ms, errors {errors}"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_graph":
+        serve_graph(int(sys.argv[2]), float(sys.argv[3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "_app":
+        serve_app(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+    else:
+        main()
@@ -0,0 +1,95 @@
+# Gunicorn settings and hooks, used by `python run.py` (SERVER="gunicorn") and
+# by `gunicorn -c gunicorn.conf.py run:app`. Values come from the same
+# environment/.env settings as the app (see app/config.py).
+import os
+
+from dotenv import load_dotenv
+
+# Importing app.config below imports the whole app, so with gevent workers the
+# standard library is patched first; run.py does the same for `python run.py`
+load_dotenv()
+if os.getenv("SERVER_WORKER_CLASS") == "gevent":
+    from gevent import monkey
+
+    monkey.patch_all()
+
+import logging  # noqa: E402
+import multiprocessing  # noqa: E402
+import types  # noqa: E402
+
+from app.config import load_configurations  # noqa: E402
+
+_holder = types.SimpleNamespace(config={})
+load_configurations(_holder)
+_settings = _holder.config
+
+bind = f"{_settings['SERVER_HOST']}:{_settings['SERVER_PORT']}"
+worker_class = _settings["SERVER_WORKER_CLASS"]
+threads = _settings["SERVER_THREADS"]
+
+# Webhook handling waits on the Graph and OpenAI APIs, so the usual
+# 2 x CPUs + 1 applies to threaded workers; gevent workers multiplex
+# connections themselves and need one per CPU
+workers = _settings["SERVER_WORKERS"] or (
+    multiprocessing.cpu_count() if worker_class == "gevent" else multiprocessing.cpu_count() * 2 + 1
+)
+if _settings["STORAGE_BACKEND"] == "json" and workers > 1:
+    # Each worker would hold its own copy of the JSON file and overwrite the
+    # others' changes; only SQLite is safe to share between processes
+    logging.warning("STORAGE_BACKEND is json, running a single worker; use sqlite for more")
+    workers = 1
+
+# Build the app once in the master so workers fork with it already imported.
+# Nothing in it opens files, sockets or threads until first use in a worker.
+# gevent workers still load the app per worker, so whatever it sets up at
+# import belongs to the worker's own hub.
+preload_app = _settings["SERVER_PRELOAD"] and worker_class != "gevent"
+
+# A webhook may wait out a whole assistant run; workers get the rest of
+# graceful_timeout to drain queued replies and outbound messages on exit
+timeout = _settings["SERVER_TIMEOUT"]
+graceful_timeout = _settings["SERVER_GRACEFUL_TIMEOUT"]
+keepalive = 5
+
+# Recycle workers after this many requests (with jitter so they do not all
+# restart together); 0 disables it
+max_requests = _settings["SERVER_MAX_REQUESTS"]
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+
+def when_ready(server):
+    server.log.info(f"Serving on {bind} with {workers} {worker_class} workers, preload={preload_app}")
+
+
+def post_worker_init(worker):
+    # Storage, HTTP sessions, the OpenAI client and every thread pool are
+    # pid-aware and built on first use, so each worker starts with its own.
+    # Token buckets are per process too, so each worker takes its share.
+    if workers > 1:
+        scheduler = worker.wsgi.extensions.get("outbound_scheduler")
+        if scheduler is not None:
+            scheduler.share(workers)
+        # Broadcasts use the same scheduler, or their own when it is disabled
+        broadcast_scheduler = worker.wsgi.extensions["broadcasts"].scheduler
+        if broadcast_scheduler is not scheduler:
+            broadcast_scheduler.share(workers)
+
+    # Open storage now rather than on the first webhook
+    from app.data import storage
+
+    storage.get()
+    worker.log.info(f"Worker {worker.pid} ready")
+
+
+def worker_exit(server, worker):
+    # Drain background work and flush storage before the worker goes away;
+    # this runs for graceful stops, reloads (HUP) and max_requests recycling
+    from app import shutdown_app
+
+    if getattr(worker, "wsgi", None) is None:
+        # Failed before the app was loaded; there is nothing to drain
+        return
+    shutdown_app(worker.wsgi, timeout=graceful_timeout / 3)
+    server.log.info(f"Worker {worker.pid} shut down")
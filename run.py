@@ -1,10 +1,62 @@
-import logging
+import os
 
-from app import create_app
+from dotenv import load_dotenv
+
+# gevent has to patch the standard library before anything imports ssl,
+# socket or threading, and importing the app below does all three; patching
+# in the worker, as gunicorn's gevent worker does, comes too late
+load_dotenv()
+if os.getenv("SERVER", "gunicorn") == "gunicorn" and os.getenv("SERVER_WORKER_CLASS") == "gevent":
+    from gevent import monkey
+
+    monkey.patch_all()
+
+import logging  # noqa: E402
+
+from app import create_app  # noqa: E402
 
 
 app = create_app()
 
+
+def run_gunicorn():
+    """Serve `app` with gunicorn, using the settings and hooks in gunicorn.conf.py."""
+    from gunicorn.app.base import Application
+
+    class ProductionServer(Application):
+        def init(self, parser, opts, args):
+            pass
+
+        def load_config(self):
+            self.load_config_from_file("gunicorn.conf.py")
+
+        def load(self):
+            if self.cfg.preload_app:
+                # Called once in the master; the workers fork from this app
+                return app
+            # Called in each worker, so it gets an app built there
+            return create_app()
+
+    ProductionServer().run()
+
+
 if __name__ == "__main__":
-    logging.info("Flask app started")
-    app.run(host="0.0.0.0", port=8000)
+    server = app.config["SERVER"]
+    if server == "gunicorn":
+        try:
+            run_gunicorn()
+        except ImportError as e:
+            # e.g. on Windows, where gunicorn does not run
+            logging.warning(f"gunicorn is unavailable ({e}), using the threaded server")
+            server = "threaded"
+    if server == "aiohttp":
+        from aiohttp import web
+
+        from app.async_app import create_async_app
+
+        web.run_app(create_async_app(app), host=app.config["SERVER_HOST"], port=app.config["SERVER_PORT"])
+    elif server == "threaded":
+        logging.info("Flask app started")
+        app.run(host=app.config["SERVER_HOST"], port=app.config["SERVER_PORT"], threaded=True)
+    elif server != "gunicorn":
+        raise SystemExit(f"Unknown SERVER: {server}")
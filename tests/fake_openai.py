@@ -0,0 +1,160 @@
+"""
+A minimal stand-in for the OpenAI Assistants API, for driving RunDriver.
+
+Serves just the run endpoints RunDriver uses: create (plain or streamed over
+server-sent events), retrieve and cancel. How a run behaves is set through
+`FakeOpenAI.scenario`.
+"""
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUNS_PATH = re.compile(r"/v1/threads/(\w+)/runs$")
+RUN_PATH = re.compile(r"/v1/threads/(\w+)/runs/(\w+)$")
+CANCEL_PATH = re.compile(r"/v1/threads/(\w+)/runs/(\w+)/cancel$")
+
+
+class Scenario:
+    """
+    How the next runs behave.
+
+    A run reports `in_progress` `steps` times (one poll or one streamed event
+    each, `step_delay` seconds apart) and then ends in `final`. With `stall`,
+    a stream goes quiet after those events until the server is stopped.
+    """
+
+    def __init__(self, final="completed", steps=2, step_delay=0.01, stall=False):
+        self.final = final
+        self.steps = steps
+        self.step_delay = step_delay
+        self.stall = stall
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.scenario = Scenario()
+        self.runs = {}
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def cancelled(self):
+        return [run["id"] for run in self.runs.values() if run["status"] == "cancelled"]
+
+    def _new_run(self, thread_id):
+        run = {"id": f"run_{next(self._ids)}", "thread_id": thread_id, "status": "queued", "polls": 0}
+        self.runs[run["id"]] = run
+        return run
+
+    @staticmethod
+    def _run_object(run):
+        last_error = {"code": "server_error", "message": "boom"} if run["status"] == "failed" else None
+        return {
+            "id": run["id"],
+            "object": "thread.run",
+            "thread_id": run["thread_id"],
+            "assistant_id": "asst_test",
+            "status": run["status"],
+            "last_error": last_error,
+        }
+
+    @staticmethod
+    def _message_object(run):
+        return {
+            "id": f"msg_{run['id']}",
+            "object": "thread.message",
+            "thread_id": run["thread_id"],
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "text", "text": {"value": "streamed reply", "annotations": []}}],
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _event(self, name, data):
+                self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+
+            def do_POST(self):
+                fake.requests.append(("POST", self.path))
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                match = CANCEL_PATH.match(self.path)
+                if match:
+                    run = fake.runs[match[2]]
+                    run["status"] = "cancelled"
+                    return self._json(fake._run_object(run))
+                match = RUNS_PATH.match(self.path)
+                if match:
+                    run = fake._new_run(match[1])
+                    if body.get("stream"):
+                        return self._stream(run)
+                    return self._json(fake._run_object(run))
+                self.send_error(404)
+
+            def do_GET(self):
+                fake.requests.append(("GET", self.path))
+                match = RUN_PATH.match(self.path)
+                if not match:
+                    return self.send_error(404)
+                run = fake.runs[match[2]]
+                if run["status"] != "cancelled":
+                    run["polls"] += 1
+                    run["status"] = fake.scenario.final if run["polls"] > fake.scenario.steps else "in_progress"
+                self._json(fake._run_object(run))
+
+            def _stream(self, run):
+                scenario = fake.scenario
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                try:
+                    self._event("thread.run.created", fake._run_object(run))
+                    run["status"] = "in_progress"
+                    self._event("thread.run.in_progress", fake._run_object(run))
+                    for _ in range(scenario.steps):
+                        if fake._stopped.wait(scenario.step_delay) or run["status"] == "cancelled":
+                            return
+                        self._event("thread.run.in_progress", fake._run_object(run))
+                    if scenario.stall:
+                        fake._stopped.wait()
+                        return
+                    if scenario.final == "completed":
+                        self._event("thread.message.completed", fake._message_object(run))
+                    run["status"] = scenario.final
+                    self._event(f"thread.run.{scenario.final}", fake._run_object(run))
+                    self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the stream
+                    pass
+
+        return Handler
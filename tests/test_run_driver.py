@@ -0,0 +1,104 @@
+import time
+
+import pytest
+from openai import OpenAI
+
+from app.services.run_driver import AssistantRunError, AssistantRunTimeout, RunDriver
+
+from .fake_openai import FakeOpenAI, Scenario
+
+
+@pytest.fixture
+def fake():
+    server = FakeOpenAI().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(fake):
+    return OpenAI(base_url=fake.base_url, api_key="test", max_retries=0)
+
+
+def make_driver(client, streaming, **kwargs):
+    kwargs.setdefault("poll_min_interval", 0.01)
+    kwargs.setdefault("poll_max_interval", 0.02)
+    requests = []
+    driver = RunDriver(client, streaming=streaming, on_request=lambda: requests.append(1), **kwargs)
+    return driver, requests
+
+
+def test_streaming_returns_run_and_messages_in_one_request(fake, client):
+    driver, requests = make_driver(client, streaming=True)
+
+    run, messages = driver.run("thread_1", "asst_test")
+
+    assert run.status == "completed"
+    assert [m.content[0].text.value for m in messages] == ["streamed reply"]
+    assert len(requests) == 1
+    assert fake.requests == [("POST", "/v1/threads/thread_1/runs")]
+
+
+def test_polling_waits_for_completion(fake, client):
+    fake.scenario = Scenario(steps=3)
+    driver, requests = make_driver(client, streaming=False)
+
+    run, messages = driver.run("thread_1", "asst_test")
+
+    assert run.status == "completed"
+    assert messages is None
+    # One create, then polls until the fourth retrieve reports completion
+    assert len(requests) == 5
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+@pytest.mark.parametrize("final", ["failed", "expired", "cancelled"])
+def test_other_terminal_states_raise(fake, client, streaming, final):
+    fake.scenario = Scenario(final=final)
+    driver, _ = make_driver(client, streaming=streaming)
+
+    with pytest.raises(AssistantRunError) as excinfo:
+        driver.run("thread_1", "asst_test")
+
+    assert excinfo.value.status == final
+    assert not isinstance(excinfo.value, AssistantRunTimeout)
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_requires_action_is_cancelled(fake, client, streaming):
+    fake.scenario = Scenario(final="requires_action")
+    driver, _ = make_driver(client, streaming=streaming)
+
+    with pytest.raises(AssistantRunError) as excinfo:
+        driver.run("thread_1", "asst_test")
+
+    assert excinfo.value.status == "requires_action"
+    assert fake.cancelled() == [excinfo.value.run_id]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_deadline_cancels_a_slow_run(fake, client, streaming):
+    fake.scenario = Scenario(steps=1000, step_delay=0.05)
+    driver, _ = make_driver(client, streaming=streaming, deadline=0.3)
+
+    start = time.monotonic()
+    with pytest.raises(AssistantRunTimeout) as excinfo:
+        driver.run("thread_1", "asst_test")
+
+    assert time.monotonic() - start < 1.0
+    assert excinfo.value.status == "in_progress"
+    assert fake.cancelled() == [excinfo.value.run_id]
+
+
+def test_deadline_holds_when_the_stream_stalls(fake, client):
+    # Goes quiet after a few events; the HTTP read timeout alone would only
+    # fire a whole deadline after the last one
+    fake.scenario = Scenario(steps=2, step_delay=0.1, stall=True)
+    driver, _ = make_driver(client, streaming=True, deadline=2.0)
+
+    start = time.monotonic()
+    with pytest.raises(AssistantRunTimeout) as excinfo:
+        driver.run("thread_1", "asst_test")
+
+    assert time.monotonic() - start < 2.5
+    assert fake.cancelled() == [excinfo.value.run_id]